@@ -0,0 +1,103 @@
+"""
+An asyncio interface to the glossary. Requires Python 3.
+
+Store calls and command handlers run on a single worker thread, so slow
+queries and commits don't block the event loop. ``SQLiteGlossary`` keeps a
+connection per thread, so the worker gets its own, but its caches and
+redirect map are shared: the sync API keeps working on other threads and sees
+the worker's writes, and the other way around.
+
+    store = AsyncGlossary()
+    record = await store.get_latest_record('fish')
+    response = await query_command(
+        client=client, event=event, channel=channel, nick=nick, rest='fish'
+    )
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from pmx_glossary import glossary
+
+
+class AsyncGlossary(object):
+    """
+    Exposes every store method as a coroutine run on a worker thread.
+
+    ``store`` defaults to ``Glossary.store``, looked up on each call.
+    """
+    def __init__(self, store=None):
+        self._store = store
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    @property
+    def store(self):
+        if self._store is None:
+            return glossary.Glossary.store
+
+        return self._store
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Calls ``func`` on the worker thread and returns its result.
+        """
+        loop = asyncio.get_running_loop()
+
+        return await loop.run_in_executor(
+            self.executor, functools.partial(func, *args, **kwargs)
+        )
+
+    def __getattr__(self, name):
+        method = getattr(self.store, name)
+
+        if not callable(method):
+            raise AttributeError(name)
+
+        @functools.wraps(method)
+        async def call(*args, **kwargs):
+            return await self.run(method, *args, **kwargs)
+
+        return call
+
+    async def close(self):
+        """
+        Closes the worker's connection and stops the worker.
+        """
+        await self.run(self.store.close)
+        self.executor.shutdown(wait=True)
+
+
+_worker = None
+
+
+def get_worker():
+    """
+    Returns the AsyncGlossary the command handlers run on, creating it (and
+    its thread) on first use.
+    """
+    global _worker
+
+    if _worker is None:
+        _worker = AsyncGlossary()
+
+    return _worker
+
+
+def async_command(func):
+    """
+    Returns a coroutine function running the command handler ``func`` on the
+    worker thread.
+    """
+    @functools.wraps(func)
+    async def handler(**kwargs):
+        return await get_worker().run(func, **kwargs)
+
+    return handler
+
+
+define = async_command(glossary.define)
+query_command = async_command(glossary.query_command)
+redirect_command = async_command(glossary.redirect_command)
+remove_redirect = async_command(glossary.remove_redirect)
+search = async_command(glossary.search)
+who_wrote = async_command(glossary.who_wrote)
@@ -0,0 +1,337 @@
+"""
+Benchmarks for the glossary's command hot paths.
+
+Each run builds a synthetic glossary in a temporary SQLite database, times
+the commands against it, and reports p50/p99 latency and throughput. Results
+can be saved as json so runs can be compared::
+
+    pmxglos bench --size 1000 --size 10000 --output bench.json
+"""
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+import timeit
+
+from pmx_glossary import glossary
+
+SYLLABLES = (
+    'ka', 'lo', 'mi', 'ne', 'po', 'ru', 'sa', 'ti', 'vo', 'xe', 'zu', 'an',
+    'el', 'ir', 'os', 'ub', 'qua', 'tri', 'pho', 'gen',
+)
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+
+NICK = 'benchmark'
+
+
+def make_word(rand, syllables=3):
+    return ''.join(rand.choice(SYLLABLES) for _ in range(syllables))
+
+
+def make_entries(size, rand):
+    """
+    Returns ``size`` distinct synthetic entry names.
+    """
+    entries = []
+
+    for i in range(size):
+        if i % 5 == 0:
+            entry = '{} {}{}'.format(make_word(rand, 2), make_word(rand), i)
+        else:
+            entry = '{}{}'.format(make_word(rand), i)
+
+        entries.append(entry)
+
+    return entries
+
+
+def populate(store, entries, revisions, redirect_ratio, rand):
+    """
+    Bulk-loads ``revisions`` definitions for each entry and redirects a
+    fraction of them. Returns the list of redirect sources.
+    """
+    start = 1400000000
+
+    rows = []
+
+    for i, entry in enumerate(entries):
+        for revision in range(revisions):
+            rows.append({
+                'entry': entry,
+                'definition': '{} {} {}'.format(
+                    make_word(rand), make_word(rand, 2), make_word(rand)
+                ),
+                'author': 'author{}'.format(rand.randint(1, 50)),
+                'channel': '#channel',
+                'timestamp': str(start + i * revisions + revision),
+            })
+
+    store.add_entries(rows, match_timestamp=True)
+
+    redirects = []
+
+    for i in range(int(len(entries) * redirect_ratio)):
+        redirect_from = 'redirect{}'.format(i)
+        store.add_redirect(redirect_from, rand.choice(entries))
+        redirects.append(redirect_from)
+
+    return redirects
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+
+    index = int(round(pct / 100.0 * (len(sorted_values) - 1)))
+
+    return sorted_values[index]
+
+
+def summarize(timings):
+    """
+    Returns latency percentiles (in milliseconds) and throughput for a list
+    of timings in seconds.
+    """
+    timings = sorted(timings)
+    total = sum(timings)
+
+    return {
+        'count': len(timings),
+        'p50_ms': percentile(timings, 50) * 1000,
+        'p99_ms': percentile(timings, 99) * 1000,
+        'max_ms': timings[-1] * 1000,
+        'mean_ms': total / len(timings) * 1000,
+        'ops_per_sec': len(timings) / total if total else None,
+    }
+
+
+def time_command(func, rests):
+    """
+    Calls a command handler once per ``rest`` string, returning the timings.
+    """
+    timings = []
+
+    for rest in rests:
+        start = timeit.default_timer()
+        func(
+            client='benchmark',
+            event='benchmark',
+            channel='#benchmark',
+            nick=NICK,
+            rest=rest
+        )
+        timings.append(timeit.default_timer() - start)
+
+    return timings
+
+
+def time_call(func, *args):
+    start = timeit.default_timer()
+    result = func(*args)
+
+    return timeit.default_timer() - start, result
+
+
+def bench_commands(entries, redirects, iterations, rand):
+    """
+    Times each command handler against the current ``Glossary.store``.
+    """
+    def pick():
+        return rand.choice(entries)
+
+    def substring():
+        entry = pick()
+        start = rand.randint(0, max(0, len(entry) - 4))
+
+        return entry[start:start + 4]
+
+    cases = {
+        'query_command': (
+            glossary.query_command,
+            [pick() for _ in range(iterations)]
+        ),
+        'query_command_nth': (
+            glossary.query_command,
+            ['{}: 1'.format(pick()) for _ in range(iterations)]
+        ),
+        'query_command_redirect': (
+            glossary.query_command,
+            [rand.choice(redirects) if redirects else pick()
+             for _ in range(iterations)]
+        ),
+        'query_command_miss': (
+            glossary.query_command,
+            ['{} {}'.format(make_word(rand), make_word(rand))
+             for _ in range(iterations)]
+        ),
+        'query_command_random': (
+            glossary.query_command,
+            ['' for _ in range(iterations)]
+        ),
+        'search': (
+            glossary.search,
+            [substring() for _ in range(iterations)]
+        ),
+        'who_wrote': (
+            glossary.who_wrote,
+            [pick() for _ in range(iterations)]
+        ),
+        'define': (
+            glossary.define,
+            ['{}: {}'.format(pick(), make_word(rand, 6))
+             for _ in range(iterations)]
+        ),
+    }
+
+    results = {}
+
+    for name in sorted(cases):
+        func, rests = cases[name]
+        results[name] = summarize(time_command(func, rests))
+
+    return results
+
+
+def bench_dump_and_load(workdir, profile=None):
+    """
+    Times ``pmxglos jsondump``/``jsonload`` in both formats. Each dump is
+    loaded into a fresh database, then loaded again over the same data.
+    """
+    results = {}
+    formats = (
+        ('json', 'dump_to_json', 'load_from_json'),
+        ('ndjson', 'dump_to_ndjson', 'load_from_ndjson'),
+    )
+
+    for name, dump_method, load_method in formats:
+        dump = getattr(glossary.Glossary.store, dump_method)
+        elapsed, (_, path) = time_call(dump)
+        results['jsondump_' + name] = summarize([elapsed])
+
+        target = glossary.SQLiteGlossary(
+            'sqlite:' + os.path.join(workdir, 'load-{}.sqlite'.format(name))
+        )
+        target.apply_pragmas(profile)
+        load = getattr(target, load_method)
+
+        for label in ('jsonload_', 'jsonload_again_'):
+            elapsed, _ = time_call(load, path)
+            results[label + name] = summarize([elapsed])
+
+        target.close()
+        os.remove(path)
+
+    return results
+
+
+def run_benchmarks(
+    sizes=DEFAULT_SIZES,
+    revisions=3,
+    redirect_ratio=0.05,
+    iterations=200,
+    seed=0,
+    include_dumps=True,
+    profile=None
+):
+    """
+    Runs the benchmark suite for each glossary size.
+
+    ``profile`` names one of ``SQLiteGlossary.PRAGMA_PROFILES``, and defaults
+    to the configured one.
+
+    Returns a dict with run metadata and per-size, per-operation results.
+    """
+    report = {
+        'meta': {
+            'timestamp': int(time.time()),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'revisions': revisions,
+            'redirect_ratio': redirect_ratio,
+            'iterations': iterations,
+            'seed': seed,
+            'profile': None,
+        },
+        'results': {},
+    }
+
+    # The command handlers read ``Glossary.store``, so point it at each
+    # benchmark database in turn and put back whatever was there before.
+    previous = vars(glossary.Glossary).get('store')
+
+    try:
+        for size in sizes:
+            rand = random.Random(seed)
+            workdir = tempfile.mkdtemp(prefix='pmxbot-glossary-bench')
+            store = glossary.SQLiteGlossary(
+                'sqlite:' + os.path.join(workdir, 'bench.sqlite')
+            )
+
+            try:
+                glossary.Glossary.store = store
+                store.apply_pragmas(profile)
+                report['meta']['profile'] = store.profile
+
+                entries = make_entries(size, rand)
+                elapsed, redirects = time_call(
+                    populate, store, entries, revisions, redirect_ratio, rand
+                )
+
+                results = {'populate': summarize([elapsed])}
+                results.update(
+                    bench_commands(entries, redirects, iterations, rand)
+                )
+
+                if include_dumps:
+                    results.update(bench_dump_and_load(workdir, profile))
+
+                report['results'][str(size)] = results
+            finally:
+                store.close()
+                shutil.rmtree(workdir, ignore_errors=True)
+    finally:
+        if previous is not None:
+            glossary.Glossary.store = previous
+        elif 'store' in vars(glossary.Glossary):
+            del glossary.Glossary.store
+
+    return report
+
+
+def format_report(report):
+    """
+    Returns a plain-text table of a ``run_benchmarks`` report.
+    """
+    lines = []
+    template = '{:<26} {:>10} {:>10} {:>12}'
+
+    for size, results in sorted(
+        report['results'].items(), key=lambda item: int(item[0])
+    ):
+        lines.append('')
+        lines.append('{} entries, {} profile'.format(
+            size, report['meta'].get('profile')
+        ))
+        lines.append(
+            template.format('operation', 'p50 ms', 'p99 ms', 'ops/sec')
+        )
+
+        for name, stats in sorted(results.items()):
+            lines.append(template.format(
+                name,
+                '{:.3f}'.format(stats['p50_ms']),
+                '{:.3f}'.format(stats['p99_ms']),
+                '{:.1f}'.format(stats['ops_per_sec'] or 0),
+            ))
+
+    return '\n'.join(lines)
+
+
+def save_report(report, path):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
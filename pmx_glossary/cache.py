@@ -0,0 +1,212 @@
+import threading
+import time
+from collections import OrderedDict
+
+from pmx_glossary import stats
+
+
+class Cache(object):
+    """
+    Base class for the store's caches.
+
+    Subclasses implement ``_get``, ``set``, ``delete`` and ``clear``. The base
+    class keeps hit/miss/eviction counters so cache sizes can be tuned from
+    real traffic.
+    """
+    # Returned by ``_get`` when a key isn't cached.
+    MISSING = object()
+
+    def __init__(self):
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return 0
+
+    def __contains__(self, key):
+        return False
+
+    def get(self, key, default=None):
+        value = self._get(key)
+
+        if value is self.MISSING:
+            self.misses += 1
+            stats.record('cache_misses')
+            return default
+
+        self.hits += 1
+        stats.record('cache_hits')
+
+        return value
+
+    def _get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+
+        if not lookups:
+            return 0.0
+
+        return float(self.hits) / lookups
+
+    def stats(self):
+        return {
+            'backend': type(self).__name__,
+            'size': len(self),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'hit_rate': self.hit_rate,
+        }
+
+
+class NullCache(Cache):
+    """
+    A cache that never stores anything.
+
+    Useful for measuring the uncached cost of the store, or for deployments
+    where stale reads are not acceptable.
+    """
+    def __init__(self, **kwargs):
+        super(NullCache, self).__init__()
+
+    def _get(self, key):
+        return self.MISSING
+
+    def set(self, key, value):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+
+class LRUCache(Cache):
+    """
+    A size-bounded, least-recently-used cache with an optional TTL.
+
+    ``max_size`` is the number of keys held before the least recently used
+    one is evicted. ``ttl`` is the number of seconds a value stays valid;
+    ``None`` means values never expire on their own.
+
+    Safe to share between threads.
+    """
+    def __init__(self, max_size=1024, ttl=None):
+        if max_size < 1:
+            raise ValueError('max_size must be at least 1')
+
+        super(LRUCache, self).__init__()
+
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        with self._lock:
+            return self._lookup(key) is not None
+
+    def _lookup(self, key):
+        """
+        Returns the (expires, value) pair for a live key, or None. Callers
+        hold the lock.
+        """
+        item = self._data.get(key)
+
+        if item is None:
+            return None
+
+        expires = item[0]
+
+        if expires is not None and expires <= time.time():
+            del self._data[key]
+            self.expirations += 1
+            return None
+
+        return item
+
+    def _get(self, key):
+        with self._lock:
+            item = self._lookup(key)
+
+            if item is None:
+                return self.MISSING
+
+            # Re-insert to mark the key as most recently used.
+            del self._data[key]
+            self._data[key] = item
+
+            return item[1]
+
+    def set(self, key, value):
+        expires = time.time() + self.ttl if self.ttl else None
+
+        with self._lock:
+            if key in self._data:
+                del self._data[key]
+
+            self._data[key] = (expires, value)
+
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        stats = super(LRUCache, self).stats()
+        stats['max_size'] = self.max_size
+
+        return stats
+
+
+CACHE_BACKENDS = {
+    'lru': LRUCache,
+    'none': NullCache,
+}
+
+
+def make_cache(backend='lru', **kwargs):
+    """
+    Returns a cache instance for the named backend.
+
+    ``kwargs`` are passed through to the backend's constructor.
+    """
+    try:
+        cache_class = CACHE_BACKENDS[backend]
+    except KeyError:
+        raise ValueError(
+            'Unknown cache backend "{}". Choose from: {}'.format(
+                backend, ', '.join(sorted(CACHE_BACKENDS))
+            )
+        )
+
+    return cache_class(**kwargs)
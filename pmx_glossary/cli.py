@@ -1,23 +1,42 @@
+import json
+import time
+
 import click
 
-from pmx_glossary.glossary import Glossary
+from pmx_glossary import benchmarks, stats
+from pmx_glossary.glossary import Glossary, SQLiteGlossary, get_config
+
+# Commands that don't use the configured database.
+STANDALONE_COMMANDS = ('bench', 'stats')
 
 
 @click.group()
-def cli():
-    Glossary.initialize()
+@click.pass_context
+def cli(ctx):
+    if ctx.invoked_subcommand not in STANDALONE_COMMANDS:
+        Glossary.initialize()
 
 
 @cli.command()
-def jsondump():
+@click.option(
+    '--format', 'format_', type=click.Choice(['json', 'ndjson']),
+    default='json',
+    help='ndjson streams one object per line and uses constant memory.'
+)
+def jsondump(format_):
     """
     Dump all entry data to a json file.
     """
-    click.secho('Dumping to json...')
-    data, filepath = Glossary.store.dump_to_json()
+    click.secho('Dumping to {}...'.format(format_))
 
-    entry_count = len(data['entries'])
-    redirect_count = len(data['redirects'])
+    if format_ == 'ndjson':
+        counts, filepath = Glossary.store.dump_to_ndjson()
+        entry_count = counts['entries']
+        redirect_count = counts['redirects']
+    else:
+        data, filepath = Glossary.store.dump_to_json()
+        entry_count = len(data['entries'])
+        redirect_count = len(data['redirects'])
 
     print(
         'Dumped {} glossary entries and {} redirects to {}'.format(
@@ -30,11 +49,16 @@ def jsondump():
 @click.argument('path', type=click.Path(exists=True))
 def jsonload(path):
     """
-    Load entry data from a json file.
+    Load entry data from a json or ndjson file.
     """
-    all_data, inserted = Glossary.store.load_from_json(path)
-    all_entries_count = len(all_data['entries'])
-    inserted_entries_count = len(inserted)
+    if Glossary.store.is_ndjson(path):
+        counts = Glossary.store.load_from_ndjson(path)
+        all_entries_count = counts['entries']
+        inserted_entries_count = counts['inserted']
+    else:
+        all_data, inserted = Glossary.store.load_from_json(path)
+        all_entries_count = len(all_data['entries'])
+        inserted_entries_count = len(inserted)
 
     print(
         'Inserted {}/{} entries from file.'.format(
@@ -56,3 +80,110 @@ def jsonload(path):
 @click.argument('path', type=click.Path(exists=True))
 def load_fixtures(path):
     Glossary.load_fixtures(path)
+
+
+@cli.command()
+@click.option('--top', default=10, help='Entries and authors to list.')
+def report(top):
+    """
+    Summarize the glossary: entry ages, most edited entries and authors.
+
+    Requires numpy.
+    """
+    try:
+        snapshot = Glossary.store.get_columnar_snapshot()
+    except ImportError as e:
+        raise click.ClickException(str(e))
+
+    print('{} entries'.format(len(snapshot)))
+
+    sections = (
+        ('Last defined within', snapshot.age_buckets()),
+        ('Most revised', snapshot.top(top, by='total_count')),
+        ('Recently defined', [
+            (entry, time.strftime('%Y-%m-%d', time.gmtime(timestamp)))
+            for entry, timestamp in snapshot.top(top, by='timestamp')
+        ]),
+        ('Top authors', snapshot.top_authors(top)),
+    )
+
+    for title, rows in sections:
+        print('')
+        print(title)
+
+        for name, value in rows:
+            print(u'  {:<40} {}'.format(name, value))
+
+
+@cli.command(name='stats')
+@click.option(
+    '--path', type=click.Path(),
+    help='Stats file to read. Defaults to the glossary_stats_path config.'
+)
+@click.option('--json', 'as_json', is_flag=True, help='Print raw json.')
+def stats_command(path, as_json):
+    """
+    Show the bot's command and store stats.
+
+    The bot saves these to the file set by ``glossary_stats_path``.
+    """
+    path = path or get_config('glossary_stats_path')
+
+    if not path:
+        raise click.UsageError(
+            'Pass --path or set glossary_stats_path in the pmxbot config.'
+        )
+
+    try:
+        snapshot = stats.Stats.load(path)
+    except IOError:
+        raise click.ClickException('No stats file found at {}'.format(path))
+
+    if as_json:
+        print(json.dumps(snapshot, indent=2, sort_keys=True))
+    else:
+        print(stats.format_snapshot(snapshot))
+
+
+@cli.command()
+@click.option(
+    '--size', 'sizes', type=int, multiple=True,
+    help='Number of entries in the synthetic glossary. Repeatable. '
+    'Defaults to 1000, 10000 and 100000.'
+)
+@click.option('--revisions', default=3, help='Definitions per entry.')
+@click.option(
+    '--redirect-ratio', default=0.05, help='Fraction of entries redirected.'
+)
+@click.option('--iterations', default=200, help='Calls timed per command.')
+@click.option('--seed', default=0, help='Random seed for the glossary.')
+@click.option('--no-dumps', is_flag=True, help='Skip jsondump/jsonload.')
+@click.option(
+    '--profile', type=click.Choice(sorted(SQLiteGlossary.PRAGMA_PROFILES)),
+    help='SQLite pragma profile. Defaults to glossary_sqlite_profile.'
+)
+@click.option(
+    '--output', type=click.Path(), help='Save the results as json here.'
+)
+def bench(
+    sizes, revisions, redirect_ratio, iterations, seed, no_dumps, profile,
+    output
+):
+    """
+    Benchmark the commands against synthetic glossaries.
+    """
+    report = benchmarks.run_benchmarks(
+        sizes=sizes or benchmarks.DEFAULT_SIZES,
+        revisions=revisions,
+        redirect_ratio=redirect_ratio,
+        iterations=iterations,
+        seed=seed,
+        include_dumps=not no_dumps,
+        profile=profile
+    )
+
+    print(benchmarks.format_report(report))
+
+    if output:
+        benchmarks.save_report(report, output)
+        print('Saved results to {}'.format(output))
@@ -0,0 +1,149 @@
+"""
+A columnar snapshot of the glossary's current entries, backed by NumPy.
+
+NumPy is optional; install it with ``pip install pmxbot-glossary[columnar]``.
+Without it, ``ColumnarSnapshot`` raises ImportError and nothing else in the
+glossary depends on it.
+"""
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Upper bounds, in seconds, of the age buckets. Older entries land in a final
+# 'older' bucket.
+AGE_BUCKETS = (
+    ('day', 24 * 60 * 60),
+    ('week', 7 * 24 * 60 * 60),
+    ('month', 30 * 24 * 60 * 60),
+    ('year', 365 * 24 * 60 * 60),
+)
+
+TOP_COLUMNS = ('total_count', 'timestamp')
+
+
+class ColumnarSnapshot(object):
+    """
+    The latest record of every entry, held as parallel arrays sorted by
+    ``entry_lower``.
+
+    Filters return boolean masks over the rows, so they can be combined with
+    ``&`` and ``|`` before looking up entries.
+    """
+    def __init__(self, records):
+        if numpy is None:
+            raise ImportError(
+                'The columnar snapshot requires numpy. Install it with '
+                '"pip install pmxbot-glossary[columnar]".'
+            )
+
+        records = sorted(records, key=lambda r: r.entry_lower)
+
+        self.entries = numpy.array([r.entry for r in records], dtype=object)
+        self.entry_lowers = numpy.array(
+            [r.entry_lower for r in records], dtype=numpy.str_
+        )
+        self.timestamps = numpy.array(
+            [r.timestamp for r in records], dtype=numpy.int64
+        )
+        self.total_counts = numpy.array(
+            [r.total_count for r in records], dtype=numpy.int64
+        )
+
+        # Authors are stored once each; author_ids index into them.
+        self.authors, self.author_ids = numpy.unique(
+            numpy.array([r.author for r in records], dtype=object),
+            return_inverse=True
+        )
+
+    def __len__(self):
+        return len(self.entries)
+
+    def contains(self, search_str):
+        """
+        Returns a mask of the entries whose names contain ``search_str``.
+        """
+        if not len(self):
+            return numpy.zeros(0, dtype=bool)
+
+        return numpy.char.find(self.entry_lowers, search_str.lower()) >= 0
+
+    def older_than(self, seconds, now=None):
+        """
+        Returns a mask of the entries last defined more than ``seconds`` ago.
+        """
+        now = time.time() if now is None else now
+
+        return self.timestamps < now - seconds
+
+    def search(self, search_str):
+        """
+        Returns display entries containing ``search_str``, ordered by
+        entry_lower.
+        """
+        return self.entries[self.contains(search_str)].tolist()
+
+    def age_buckets(self, now=None, buckets=AGE_BUCKETS):
+        """
+        Returns (label, count) pairs counting entries by the age of their
+        latest definition, youngest first.
+        """
+        now = time.time() if now is None else now
+        bounds = numpy.array([seconds for _, seconds in buckets])
+        counts = numpy.bincount(
+            numpy.searchsorted(bounds, now - self.timestamps),
+            minlength=len(bounds) + 1
+        )
+        labels = [label for label, _ in buckets] + ['older']
+
+        return list(zip(labels, counts.tolist()))
+
+    def top(self, n=10, by='total_count', mask=None):
+        """
+        Returns the ``n`` entries with the greatest ``by`` value (one of
+        ``TOP_COLUMNS``), greatest first, as (entry, value) pairs.
+
+        Pass a ``mask`` to only consider some entries.
+        """
+        if by not in TOP_COLUMNS:
+            raise ValueError(
+                'Cannot rank by "{}". Choose from: {}'.format(
+                    by, ', '.join(TOP_COLUMNS)
+                )
+            )
+
+        values = getattr(self, by + 's')
+        rows = numpy.arange(len(self))
+
+        if mask is not None:
+            rows = rows[mask]
+
+        if n < 1:
+            return []
+
+        if n < len(rows):
+            # Find the nth largest value without a full sort, then keep
+            # everything above it and the first of the entries tied with it.
+            cutoff = -numpy.partition(-values[rows], n - 1)[n - 1]
+            above = rows[values[rows] > cutoff]
+            tied = rows[values[rows] == cutoff][:n - len(above)]
+            rows = numpy.concatenate((above, tied))
+
+        # Stable, so ties stay in entry_lower order.
+        rows = rows[numpy.argsort(-values[rows], kind='stable')]
+
+        return [
+            (self.entries[i], int(values[i])) for i in rows
+        ]
+
+    def top_authors(self, n=10):
+        """
+        Returns the ``n`` authors of the most current definitions, as
+        (author, count) pairs.
+        """
+        counts = numpy.bincount(self.author_ids, minlength=len(self.authors))
+        rows = numpy.argsort(-counts, kind='stable')[:n]
+
+        return [(self.authors[i], int(counts[i])) for i in rows]
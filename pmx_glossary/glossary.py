@@ -1,15 +1,31 @@
+import bisect
 import calendar
+import contextlib
 import datetime
+import itertools
 import json
+import logging
 import random
+import re
+import sqlite3
 import string
 import tempfile
+import threading
+import time
+import weakref
 from collections import namedtuple
 
 import pmxbot
 from pmxbot import storage
 from pmxbot.core import command, AliasHandler, CommandHandler
 
+from pmx_glossary import stats
+from pmx_glossary.cache import make_cache
+from pmx_glossary.columnar import ColumnarSnapshot
+from pmx_glossary.index import NgramIndex
+
+log = logging.getLogger(__name__)
+
 DEFINE_COMMAND = 'define'
 QUERY_COMMAND = 'whatis'
 SEARCH_COMMAND = 'search'
@@ -19,7 +35,9 @@ REMOVE_REDIRECT_COMMAND = 'unredirect'
 ARCHIVES_LINK_COMMAND = 'tardis'
 
 HELP_DEFINE_STR = '!{} <entry>: <definition>'.format(DEFINE_COMMAND)
-HELP_QUERY_STR = '!{} <entry> [: num]'.format(QUERY_COMMAND)
+HELP_QUERY_STR = '!{0} <entry> [: num] or !{0} <entry>, <entry>...'.format(
+    QUERY_COMMAND
+)
 HELP_SEARCH_STR = '!{} <search terms>'.format(SEARCH_COMMAND)
 HELP_REDIRECT_STR = '!{} <redirect from>:<redirect to>'.format(REDIRECT_COMMAND)
 HELP_REMOVE_REDIRECT_STR = '!{} <entry>'.format(REMOVE_REDIRECT_COMMAND)
@@ -48,8 +66,24 @@ QUERY_RESULT_TEMPLATE = (
 
 UNDEFINED_TEMPLATE = u'"{}" is undefined.'
 
+# Most suggestions offered for an undefined entry.
+SUGGESTION_LIMIT = 10
+
+# Shorter query words only suggest entries starting with them.
+MIN_SUBSTRING_LENGTH = 3
+
+# Most entries looked up by one `!whatis a, b, c`.
+BATCH_QUERY_LIMIT = 20
+
 INVALID_ENTRY_CHARS = [c for c in string.punctuation if c not in ['_', '-']]
 
+# What ``SQLiteGlossary.apply_pragmas`` accepts from the config.
+PRAGMA_NAME_RE = re.compile(r'^[a-z_]+$')
+PRAGMA_VALUE_RE = re.compile(r'^-?\w+$')
+
+# Distinguishes "not cached" from a cached None.
+_missing = object()
+
 
 class InvalidEntryError(Exception):
     pass
@@ -63,8 +97,7 @@ class InvalidEntryNumberError(Exception):
     """
     Raised when user requests a numbered entry that does not exist.
     """
-    def __init__(self, entry, entries, redirect=None):
-        count = len(entries)
+    def __init__(self, entry, count, redirect=None):
         valid_records_str = 'Valid record numbers are 1-{}.'.format(count)
 
         if redirect:
@@ -83,6 +116,20 @@ class InvalidEntryNumberError(Exception):
         super(InvalidEntryNumberError, self).__init__(message)
 
 
+def get_config(key, default=None):
+    """
+    Returns a value from the pmxbot config, or ``default`` if it isn't set.
+    """
+    config = getattr(pmxbot, 'config', None) or {}
+
+    return config.get(key, default)
+
+
+# The commands and store below are instrumented as they're defined, so this
+# is read once, when the plugin is imported.
+stats.registry.enabled = bool(get_config('glossary_stats', True))
+
+
 def override_command(name, aliases=None, doc=None, priority=2):
     """
     Command decorator that accepts a priority argument.
@@ -120,12 +167,23 @@ class Glossary(storage.SelectableStorage):
         if load_fixtures:
             cls.load_fixtures()
 
+        stats_path = get_config('glossary_stats_path')
+
+        if stats_path:
+            stats.registry.configure_dump(
+                stats_path, int(get_config('glossary_stats_interval', 60))
+            )
+
         cls._finalizers.append(cls.finalize)
 
     @classmethod
     def finalize(cls):
+        cls.store.shutdown()
         del cls.store
 
+        if stats.registry.dump_path:
+            stats.registry.dump(stats.registry.dump_path)
+
     @classmethod
     def load_fixtures(cls, path=None):
         config_path_key = 'glossary_fixtures_path'
@@ -152,15 +210,60 @@ class Glossary(storage.SelectableStorage):
 
         If the definition already exists in the history for the entry,
         this will not re-add it.
+
+        Returns a tuple of (inserted, skipped) lists, as ``add_entries``.
         """
-        for entry, definition in data.items():
-            existing = cls.store.get_all_records_for_entry(entry)
-            existing_defs = [e.definition for e in existing]
+        rows = [
+            dict(entry=entry, definition=definition, author='the defaults')
+            for entry, definition in data.items()
+        ]
+
+        return cls.store.add_entries(rows)
 
-            if definition not in existing_defs:
-                cls.store.add_entry(entry, definition, 'the defaults')
+
+class SharedState(object):
+    """
+    The in-memory state of a store that all of its threads share.
+
+    ``SQLiteStorage`` is a ``threading.local``, so each thread gets its own
+    connection and attributes. The caches, snapshot, entry index, redirect
+    map and write-behind queue live here instead, so a write on one thread is
+    seen (and flushed) by the others. ``lock`` guards rebuilding and patching
+    them, and is held while queued writes are committed.
+    """
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.flush_ready = threading.Condition(self.lock)
+
+
+class SharedAttribute(object):
+    """
+    A store attribute kept on the store's SharedState rather than per thread.
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, store, owner):
+        if store is None:
+            return self
+
+        return getattr(store.shared, self.name)
+
+    def __set__(self, store, value):
+        setattr(store.shared, self.name, value)
 
 
+@stats.instrument(
+    'store',
+    exclude=(
+        'init_shared_state', 'init_tables', 'table_exists',
+        'init_latest_table', 'init_fts_table', 'execute', 'executemany',
+        'transaction', 'latest_row_to_record', 'rows_to_records', 'write',
+        'is_dirty', 'maybe_flush', 'start_flusher', 'run_flusher', 'shutdown',
+        'bust_entry_cache', 'get_redirect_chain', 'resolve_redirect',
+        'get_cached_suggestions', 'cache_suggestions',
+    )
+)
 class SQLiteGlossary(Glossary, storage.SQLiteStorage):
     CREATE_GLOSSARY_SQL = """
       CREATE TABLE IF NOT EXISTS glossary (
@@ -174,8 +277,16 @@ class SQLiteGlossary(Glossary, storage.SQLiteStorage):
     )
     """
 
+    # Serves exact entry_lower lookups in revision order. The rowid
+    # (entryid) is implicitly the last column, breaking timestamp ties.
     CREATE_GLOSSARY_INDEX_SQL = """
-      CREATE INDEX IF NOT EXISTS ix_glossary_entry ON glossary(entry_lower)
+      CREATE INDEX IF NOT EXISTS ix_glossary_entry_timestamp
+      ON glossary(entry_lower, timestamp)
+    """
+
+    # The original single-column index, made redundant by the one above.
+    DROP_OLD_GLOSSARY_INDEX_SQL = """
+      DROP INDEX IF EXISTS ix_glossary_entry
     """
 
     CREATE_REDIRECTS_SQL = """
@@ -191,9 +302,245 @@ class SQLiteGlossary(Glossary, storage.SQLiteStorage):
       ON glossary_redirects(redirect_from)
     """
 
-    ALL_ENTRIES_CACHE_KEY = 'all_entries'
+    # One row per entry_lower pointing at its latest revision, maintained by
+    # triggers on glossary. Latest means greatest (timestamp, entryid).
+    CREATE_LATEST_SQL = """
+      CREATE TABLE glossary_latest (
+       entry_lower VARCHAR PRIMARY KEY,
+       entryid INTEGER NOT NULL,
+       total_count INTEGER NOT NULL
+    )
+    """
+
+    CREATE_LATEST_INDEX_SQL = """
+      CREATE INDEX IF NOT EXISTS ix_glossary_latest_entryid
+      ON glossary_latest(entryid)
+    """
+
+    CREATE_LATEST_TRIGGERS_SQL = (
+        """
+        CREATE TRIGGER IF NOT EXISTS glossary_latest_insert
+        AFTER INSERT ON glossary BEGIN
+          INSERT OR IGNORE INTO glossary_latest
+            (entry_lower, entryid, total_count)
+          VALUES (new.entry_lower, new.entryid, 0);
+
+          UPDATE glossary_latest
+          SET total_count = total_count + 1,
+            entryid = CASE
+              WHEN (
+                SELECT timestamp FROM glossary
+                WHERE entryid = glossary_latest.entryid
+              ) > new.timestamp THEN entryid
+              ELSE new.entryid
+            END
+          WHERE entry_lower = new.entry_lower;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS glossary_latest_delete
+        AFTER DELETE ON glossary BEGIN
+          UPDATE glossary_latest
+          SET total_count = total_count - 1,
+            entryid = COALESCE(
+              (
+                SELECT entryid FROM glossary
+                WHERE entry_lower = old.entry_lower
+                ORDER BY timestamp DESC, entryid DESC
+                LIMIT 1
+              ),
+              entryid
+            )
+          WHERE entry_lower = old.entry_lower;
+
+          DELETE FROM glossary_latest
+          WHERE entry_lower = old.entry_lower AND total_count < 1;
+        END
+        """,
+    )
+
+    POPULATE_LATEST_SQL = """
+      INSERT INTO glossary_latest (entry_lower, entryid, total_count)
+      SELECT counts.entry_lower,
+        (
+          SELECT entryid
+          FROM glossary
+          WHERE entry_lower = counts.entry_lower
+          ORDER BY timestamp DESC, entryid DESC
+          LIMIT 1
+        ),
+        counts.total
+      FROM (
+        SELECT entry_lower, COUNT(entry_lower) AS total
+        FROM glossary
+        GROUP BY entry_lower
+      ) counts
+    """
+
+    # External-content FTS5 table over definitions. The trigram tokenizer
+    # gives the same substring semantics as ``LIKE '%term%'``.
+    CREATE_FTS_SQL = """
+      CREATE VIRTUAL TABLE glossary_fts USING fts5(
+        definition,
+        content='glossary',
+        content_rowid='entryid',
+        tokenize='trigram'
+      )
+    """
+
+    CREATE_FTS_TRIGGERS_SQL = (
+        """
+        CREATE TRIGGER IF NOT EXISTS glossary_fts_insert
+        AFTER INSERT ON glossary BEGIN
+          INSERT INTO glossary_fts (rowid, definition)
+          VALUES (new.entryid, new.definition);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS glossary_fts_delete
+        AFTER DELETE ON glossary BEGIN
+          INSERT INTO glossary_fts (glossary_fts, rowid, definition)
+          VALUES ('delete', old.entryid, old.definition);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS glossary_fts_update
+        AFTER UPDATE ON glossary BEGIN
+          INSERT INTO glossary_fts (glossary_fts, rowid, definition)
+          VALUES ('delete', old.entryid, old.definition);
+          INSERT INTO glossary_fts (rowid, definition)
+          VALUES (new.entryid, new.definition);
+        END
+        """,
+    )
+
+    # The trigram tokenizer can't match anything shorter than this.
+    FTS_MIN_SEARCH_LENGTH = 3
+
+    # PRAGMAs applied to every connection, chosen with the
+    # ``glossary_sqlite_profile`` config key. ``glossary_sqlite_pragmas``
+    # overrides individual values. pmxbot's connection already waits up to
+    # 20 seconds on a locked database; set ``busy_timeout`` (in ms) there to
+    # change that.
+    PRAGMA_PROFILES = {
+        # SQLite's defaults: a rollback journal and synchronous=FULL.
+        'default': {},
+        # WAL lets readers such as ``pmxglos jsondump`` run alongside the
+        # bot's writes. With synchronous=NORMAL, commits aren't fsynced until
+        # a checkpoint, so a power loss can drop the latest transactions but
+        # can't corrupt the database.
+        'fast': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'mmap_size': 256 * 1024 * 1024,
+            'cache_size': -16 * 1024,
+            'temp_store': 'MEMORY',
+        },
+        # WAL, fsyncing every commit.
+        'durable': {
+            'journal_mode': 'WAL',
+            'synchronous': 'FULL',
+        },
+    }
+
+    COLUMNAR_CACHE_KEY = 'columnar'
+
+    RECORDS_CACHE_KEY = 'records'
+    LATEST_CACHE_KEY = 'latest'
+    REVISIONS_CACHE_KEY = 'revisions'
+
+    # Entries per IN (...) query, well under SQLite's older limit of 999
+    # host parameters.
+    IN_CHUNK_SIZE = 500
+
+    # Maps each store to the SharedState its threads use.
+    shared_states = weakref.WeakKeyDictionary()
+    shared_states_lock = threading.Lock()
+
+    lock = SharedAttribute('lock')
+    cache = SharedAttribute('cache')
+    miss_cache = SharedAttribute('miss_cache')
+    snapshot = SharedAttribute('snapshot')
+    entry_index = SharedAttribute('entry_index')
+    redirects = SharedAttribute('redirects')
+    max_redirect_hops = SharedAttribute('max_redirect_hops')
+    write_behind = SharedAttribute('write_behind')
+    flush_size = SharedAttribute('flush_size')
+    flush_interval = SharedAttribute('flush_interval')
+    pending = SharedAttribute('pending')
+    pending_since = SharedAttribute('pending_since')
+    dirty = SharedAttribute('dirty')
+    flush_ready = SharedAttribute('flush_ready')
+    flusher = SharedAttribute('flusher')
+
+    def __init__(self, uri):
+        # Runs again for each thread that uses the store, so only the first
+        # run sets up the shared state.
+        with self.shared_states_lock:
+            self.shared = self.shared_states.get(self)
+
+            if self.shared is None:
+                self.shared = self.shared_states[self] = SharedState()
+                self.init_shared_state()
+
+        self.transaction_depth = 0
+
+        # Setting up this thread's connection doesn't need to see queued
+        # writes, so it leaves them for the flusher.
+        self.connected = False
+        super(SQLiteGlossary, self).__init__(uri)
+        self.connected = True
+
+    def init_shared_state(self):
+        ttl = get_config('glossary_cache_ttl')
+
+        # Holds per-entry records and revisions keyed by
+        # (kind, entry_lower), and the columnar snapshot.
+        self.cache = make_cache(
+            get_config('glossary_cache', 'lru'),
+            max_size=int(get_config('glossary_cache_size', 1024)),
+            ttl=float(ttl) if ttl else None,
+        )
+
+        # Suggestions for undefined entries, keyed by entry_lower. Adding a
+        # new entry name can change any of them, so that clears it.
+        self.miss_cache = make_cache(
+            get_config('glossary_cache', 'lru'),
+            max_size=int(get_config('glossary_miss_cache_size', 256)),
+            ttl=float(ttl) if ttl else None,
+        )
+
+        # The latest record of every entry, and a substring index over their
+        # names, built on first use. They are patched on insert and dropped
+        # when they can't be, rather than left to the cache to evict.
+        self.snapshot = None
+        self.entry_index = None
+
+        # The whole redirect table, mapping redirect_from to redirect_to. It
+        # is read in init_tables and updated by every redirect write.
+        self.redirects = None
+        self.max_redirect_hops = max(
+            1, int(get_config('glossary_redirect_max_hops', 1))
+        )
+
+        # In write-behind mode, writes are queued here and committed in a
+        # single transaction once ``flush_size`` are pending or the oldest
+        # is ``flush_interval`` seconds old, by the ``flusher`` thread if no
+        # write comes along to do it. Reads flush first, except per-entry
+        # reads of entries no queued write touches (``dirty``).
+        self.write_behind = get_config('glossary_write_behind', False)
+        self.flush_size = int(get_config('glossary_write_behind_size', 100))
+        self.flush_interval = float(
+            get_config('glossary_write_behind_interval', 5)
+        )
+        self.pending = []
+        self.pending_since = None
+        self.dirty = set()
+        self.flusher = None
 
-    cache = {}
+    def close(self):
+        self.flush()
+        super(SQLiteGlossary, self).close()
 
     @staticmethod
     def date_str_to_datetime(date_str):
@@ -205,26 +552,294 @@ class SQLiteGlossary(Glossary, storage.SQLiteStorage):
         return datetime.datetime.utcfromtimestamp(int(date_str))
 
     def init_tables(self):
-        self.db.execute(self.CREATE_GLOSSARY_SQL)
-        self.db.execute(self.CREATE_GLOSSARY_INDEX_SQL)
-        self.db.execute(self.CREATE_REDIRECTS_SQL)
-        self.db.execute(self.CREATE_REDIRECT_INDEX_SQL)
+        self.apply_pragmas()
+
+        self.execute(self.CREATE_GLOSSARY_SQL)
+        self.execute(self.CREATE_GLOSSARY_INDEX_SQL)
+        self.execute(self.DROP_OLD_GLOSSARY_INDEX_SQL)
+        self.execute(self.CREATE_REDIRECTS_SQL)
+        self.execute(self.CREATE_REDIRECT_INDEX_SQL)
         self.db.commit()
 
-    def dump_to_json(self):
+        self.init_latest_table()
+
+        # Other threads' connections find the map already loaded.
+        if self.redirects is None:
+            self.load_redirects()
+
+        self.fts_enabled = (
+            get_config('glossary_fts', True) and self.init_fts_table()
+        )
+
+    def apply_pragmas(self, profile=None):
         """
-        Dumps all entry data to a temporary file.
+        Applies a PRAGMA profile, plus any ``glossary_sqlite_pragmas``
+        overrides, to this thread's connection.
+
+        ``profile`` defaults to the ``glossary_sqlite_profile`` config key.
         """
-        entries, redirects = [], []
+        profile = profile or get_config('glossary_sqlite_profile', 'default')
 
-        outfile = tempfile.NamedTemporaryFile(
-            mode='w',
-            prefix='pmxbot-glossary_dump',
-            suffix='.json',
-            delete=False
-        )
+        try:
+            pragmas = dict(self.PRAGMA_PROFILES[profile])
+        except KeyError:
+            raise ValueError(
+                'Unknown SQLite profile "{}". Choose from: {}'.format(
+                    profile, ', '.join(sorted(self.PRAGMA_PROFILES))
+                )
+            )
 
-        entry_sql = """
+        pragmas.update(get_config('glossary_sqlite_pragmas') or {})
+
+        for name, value in sorted(pragmas.items()):
+            # PRAGMA values can't be bound as parameters.
+            if not (
+                PRAGMA_NAME_RE.match(name) and
+                PRAGMA_VALUE_RE.match(str(value))
+            ):
+                raise ValueError(
+                    'Invalid SQLite pragma: {} = {}'.format(name, value)
+                )
+
+            self.execute('PRAGMA {} = {}'.format(name, value))
+
+        self.profile = profile
+
+    def table_exists(self, name):
+        sql = """
+          SELECT 1 FROM sqlite_master WHERE name = ?
+        """
+
+        return self.execute(sql, (name, )).fetchone() is not None
+
+    def init_latest_table(self):
+        """
+        Creates the latest-revision table, populating it for existing
+        databases.
+        """
+        if self.table_exists('glossary_latest'):
+            return
+
+        with self.transaction():
+            self.execute(self.CREATE_LATEST_SQL)
+            self.execute(self.CREATE_LATEST_INDEX_SQL)
+
+            for sql in self.CREATE_LATEST_TRIGGERS_SQL:
+                self.execute(sql)
+
+            self.execute(self.POPULATE_LATEST_SQL)
+
+    def init_fts_table(self):
+        """
+        Creates the definitions full-text index, backfilling it for existing
+        databases.
+
+        Returns False if this SQLite build lacks FTS5 or the trigram
+        tokenizer, in which case searches fall back to ``LIKE``.
+        """
+        if self.table_exists('glossary_fts'):
+            return True
+
+        try:
+            with self.transaction():
+                self.execute(self.CREATE_FTS_SQL)
+
+                for sql in self.CREATE_FTS_TRIGGERS_SQL:
+                    self.execute(sql)
+
+                self.execute(
+                    "INSERT INTO glossary_fts(glossary_fts) VALUES ('rebuild')"
+                )
+        except sqlite3.OperationalError:
+            return False
+
+        return True
+
+    def execute(self, sql, params=(), flush=True):
+        """
+        Runs a statement, recording it and the rows it returns in the stats.
+
+        Queued writes are flushed first so the statement sees them, unless
+        ``flush`` is false.
+        """
+        if flush and self.pending and self.connected:
+            self.flush()
+
+        stats.record('sql')
+        cursor = self.db.execute(sql, params)
+
+        if not stats.registry.enabled:
+            return cursor
+
+        return stats.CountingCursor(cursor, stats.registry)
+
+    def executemany(self, sql, seq_of_params):
+        if self.pending and self.connected:
+            self.flush()
+
+        stats.record('sql')
+
+        return self.db.executemany(sql, seq_of_params)
+
+    def write(self, sql, params, entry):
+        """
+        Runs a write statement affecting ``entry`` in its own transaction, or
+        queues it in write-behind mode.
+        """
+        if not self.write_behind:
+            with self.transaction():
+                self.execute(sql, params)
+
+            return
+
+        with self.lock:
+            if not self.pending:
+                self.pending_since = time.time()
+                self.start_flusher()
+                self.flush_ready.notify()
+
+            self.pending.append((sql, params))
+            self.dirty.add(entry.lower())
+            self.maybe_flush()
+
+    def is_dirty(self, entry):
+        """
+        Returns whether a queued write affects ``entry``.
+        """
+        return entry.lower() in self.dirty
+
+    def maybe_flush(self):
+        if (
+            len(self.pending) >= self.flush_size or
+            time.time() - self.pending_since >= self.flush_interval
+        ):
+            self.flush()
+
+    def flush(self):
+        """
+        Commits all queued writes in a single transaction.
+
+        Holds the lock until they're committed, so a thread reading a queued
+        entry waits for the commit rather than reading around it. If the
+        commit fails, the writes stay queued and the error is raised.
+        """
+        with self.lock:
+            if not self.pending:
+                return
+
+            pending, self.pending = self.pending, []
+            pending_since, self.pending_since = self.pending_since, None
+
+            # Rolling back reloads the redirect map, which would drop queued
+            # redirects.
+            redirects = dict(self.redirects)
+
+            try:
+                with self.transaction():
+                    for sql, group in itertools.groupby(
+                        pending, lambda w: w[0]
+                    ):
+                        self.executemany(sql, [params for _, params in group])
+            except Exception:
+                self.pending = pending + self.pending
+                self.pending_since = pending_since
+                self.redirects = redirects
+                raise
+
+            self.dirty = set()
+
+    def start_flusher(self):
+        """
+        Starts the thread flushing queued writes once the oldest is
+        ``flush_interval`` seconds old, unless it's running.
+        """
+        if self.flusher is None:
+            self.flusher = threading.Thread(
+                target=self.run_flusher, name='glossary-flusher'
+            )
+            self.flusher.daemon = True
+            self.flusher.start()
+
+    def run_flusher(self):
+        """
+        Runs on the flusher thread, with its own connection, until
+        ``shutdown``.
+        """
+        with self.lock:
+            while self.flusher is threading.current_thread():
+                if self.pending_since is None:
+                    self.flush_ready.wait()
+                    continue
+
+                delay = self.pending_since + self.flush_interval - time.time()
+
+                if delay > 0:
+                    self.flush_ready.wait(delay)
+                    continue
+
+                try:
+                    self.flush()
+                except Exception:
+                    log.exception('Error flushing queued glossary writes')
+
+                    # Try again later, e.g. once another writer is done.
+                    self.flush_ready.wait(self.flush_interval)
+
+        super(SQLiteGlossary, self).close()
+
+    def shutdown(self):
+        """
+        Commits any queued writes and stops the flusher thread.
+        """
+        with self.lock:
+            flusher, self.flusher = self.flusher, None
+            self.flush_ready.notify()
+
+        if flusher:
+            flusher.join()
+
+        self.flush()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Runs the enclosed statements in a single transaction.
+
+        Nested uses join the outermost transaction, which commits when it
+        exits cleanly and rolls back (and clears the caches) otherwise.
+        """
+        self.transaction_depth += 1
+
+        if self.transaction_depth == 1:
+            self.db.execute('BEGIN')
+
+        try:
+            yield
+        except Exception:
+            self.transaction_depth -= 1
+
+            if not self.transaction_depth:
+                self.db.rollback()
+
+                with self.lock:
+                    self.cache.clear()
+                    self.miss_cache.clear()
+                    self.snapshot = None
+                    self.entry_index = None
+                    self.load_redirects()
+
+            raise
+
+        self.transaction_depth -= 1
+
+        if not self.transaction_depth:
+            self.db.commit()
+
+    def iter_entry_data(self):
+        """
+        Yields a dict for every entry revision, reading row by row.
+        """
+        sql = """
           SELECT entry,
             entry_lower,
             definition,
@@ -235,30 +850,45 @@ class SQLiteGlossary(Glossary, storage.SQLiteStorage):
           ORDER BY entry_lower
         """
 
-        for row in self.db.execute(entry_sql):
-            entries.append({
+        for row in self.execute(sql):
+            yield {
                 'entry': row[0],
                 'entry_lower': row[1],
                 'definition': row[2],
                 'author': row[3],
                 'channel': row[4],
                 'timestamp': row[5]
-            })
+            }
 
-        redirect_sql = """
+    def iter_redirect_data(self):
+        """
+        Yields a dict for every redirect, reading row by row.
+        """
+        sql = """
           SELECT redirect_from, redirect_to
           FROM glossary_redirects
         """
 
-        for row in self.db.execute(redirect_sql):
-            redirects.append({
+        for row in self.execute(sql):
+            yield {
                 'redirect_from': row[0],
                 'redirect_to': row[1],
-            })
+            }
+
+    def dump_to_json(self):
+        """
+        Dumps all entry data to a temporary file.
+        """
+        outfile = tempfile.NamedTemporaryFile(
+            mode='w',
+            prefix='pmxbot-glossary_dump',
+            suffix='.json',
+            delete=False
+        )
 
         dump_data = {
-            'entries': entries,
-            'redirects': redirects,
+            'entries': list(self.iter_entry_data()),
+            'redirects': list(self.iter_redirect_data()),
         }
 
         json.dump(dump_data, outfile, indent=2)
@@ -267,6 +897,54 @@ class SQLiteGlossary(Glossary, storage.SQLiteStorage):
 
         return dump_data, outfile.name
 
+    def dump_to_ndjson(self):
+        """
+        Streams all entry data to a temporary newline-delimited json file.
+
+        Each line is one entry or redirect object, tagged with a ``type`` of
+        ``entry`` or ``redirect``. Rows are written as they are read, so
+        memory use doesn't grow with the glossary.
+
+        Returns a dict of entry and redirect counts, and the file path.
+        """
+        counts = {'entries': 0, 'redirects': 0}
+
+        outfile = tempfile.NamedTemporaryFile(
+            mode='w',
+            prefix='pmxbot-glossary_dump',
+            suffix='.jsonl',
+            delete=False
+        )
+
+        with outfile:
+            for entry_data in self.iter_entry_data():
+                entry_data['type'] = 'entry'
+                outfile.write(json.dumps(entry_data) + '\n')
+                counts['entries'] += 1
+
+            for redirect_data in self.iter_redirect_data():
+                redirect_data['type'] = 'redirect'
+                outfile.write(json.dumps(redirect_data) + '\n')
+                counts['redirects'] += 1
+
+        return counts, outfile.name
+
+    @staticmethod
+    def is_ndjson(filepath):
+        """
+        Returns True if filepath holds a ``dump_to_ndjson`` dump rather than
+        a ``dump_to_json`` one.
+        """
+        with open(filepath, 'r') as f:
+            first_line = f.readline()
+
+        try:
+            data = json.loads(first_line)
+        except ValueError:
+            return False
+
+        return isinstance(data, dict) and 'type' in data
+
     def load_from_json(self, filepath):
         """
         Load entries from json data in filepath (str).
@@ -275,60 +953,121 @@ class SQLiteGlossary(Glossary, storage.SQLiteStorage):
         trying to create fixtures, use a fixtures file handled by
         ``initialize``.
         """
-        records_by_entry_lower = {}
-
-        inserted = []
-
         with open(filepath, 'r') as f:
             data = json.load(f)
 
-            for entry_data in data.get('entries', []):
-                entry = entry_data['entry']
-                entry_lower = entry_data['entry_lower']
-                definition = entry_data['definition']
-                timestamp = entry_data['timestamp']
-                datetime_ = self.date_str_to_datetime(timestamp)
+        with self.transaction():
+            inserted, _ = self.add_entries(
+                data.get('entries', []), match_timestamp=True
+            )
 
-                if not entry_lower in records_by_entry_lower:
-                    records_by_entry_lower[entry_lower] = (
-                        self.get_all_records_for_entry(entry_lower)
-                    )
+            for redirect_data in data.get('redirects', []):
+                self.load_redirect(redirect_data)
 
-                existing_records = records_by_entry_lower[entry_lower]
-
-                already_exists = False
-
-                for existing in existing_records:
-                    if all([
-                        existing.entry == entry,
-                        existing.definition == definition,
-                        existing.datetime == datetime_
-                    ]):
-                        already_exists = True
-                        break
-
-                if not already_exists:
-                    self.add_entry(
-                        entry,
-                        definition,
-                        entry_data['author'],
-                        entry_data['channel'],
-                        datetime_
-                    )
+        return data, inserted
 
-                    inserted.append(entry_data)
+    def load_from_ndjson(self, filepath, batch_size=1000):
+        """
+        Load entries from a ``dump_to_ndjson`` file, reading line by line.
 
-            for redirect_data in data.get('redirects', []):
-                self.add_redirect(
-                    redirect_data['redirect_from'],
-                    redirect_data['redirect_to']
-                )
+        Entries are inserted in batches of ``batch_size`` within a single
+        transaction. Each batch is checked against the database for
+        duplicates on its own, so memory use depends on ``batch_size`` rather
+        than the size of the glossary. Returns a dict of counts: ``entries``
+        read, ``inserted`` and ``redirects``.
+        """
+        counts = {'entries': 0, 'inserted': 0, 'redirects': 0}
+        batch, redirects = [], []
+
+        def flush():
+            inserted, _ = self.add_entries(batch, match_timestamp=True)
+            counts['inserted'] += len(inserted)
+            del batch[:]
+
+        with open(filepath, 'r') as f, self.transaction():
+            for line in f:
+                if not line.strip():
+                    continue
+
+                data = json.loads(line)
 
-            return data, inserted
+                if data.get('type') == 'redirect':
+                    redirects.append(data)
+                    continue
+
+                batch.append(data)
+                counts['entries'] += 1
+
+                if len(batch) >= batch_size:
+                    flush()
+
+            flush()
+
+            # Redirects need their targets loaded first.
+            for redirect_data in redirects:
+                self.load_redirect(redirect_data)
+
+            counts['redirects'] = len(redirects)
+
+        return counts
+
+    def load_redirect(self, redirect_data):
+        """
+        Adds a dumped redirect unless it's already in place.
+        """
+        redirect_from = redirect_data['redirect_from'].lower()
+        redirect_to = redirect_data['redirect_to'].lower()
+
+        if self.redirects.get(redirect_from) != redirect_to:
+            self.add_redirect(redirect_from, redirect_to)
 
     def bust_all_entries_cache(self):
-        if self.ALL_ENTRIES_CACHE_KEY in self.cache:
-            del self.cache[self.ALL_ENTRIES_CACHE_KEY]
+        with self.lock:
+            self.snapshot = None
+            self.cache.delete(self.COLUMNAR_CACHE_KEY)
+            self.miss_cache.clear()
+            self.entry_index = None
+
+    def bust_entry_cache(self, entry):
+        entry_lower = entry.lower()
+        self.cache.delete((self.RECORDS_CACHE_KEY, entry_lower))
+        self.cache.delete((self.LATEST_CACHE_KEY, entry_lower))
+        self.cache.delete((self.REVISIONS_CACHE_KEY, entry_lower))
+
+    def load_redirects(self):
+        """
+        Reads the redirect table into ``redirects``.
+        """
+        sql = """
+          SELECT redirect_from, redirect_to FROM glossary_redirects
+        """
+
+        self.redirects = dict(self.execute(sql).fetchall())
+
+    def get_redirect_chain(self, entry):
+        """
+        Returns the entries an entry redirects through, in order, stopping
+        before any entry already in the chain.
+        """
+        chain = []
+        seen = set([entry.lower()])
+        redirect_to = self.redirects.get(entry.lower())
+
+        while redirect_to is not None and redirect_to not in seen:
+            chain.append(redirect_to)
+            seen.add(redirect_to)
+            redirect_to = self.redirects.get(redirect_to)
+
+        return chain
+
+    def resolve_redirect(self, entry):
+        """
+        Returns the entry_lower an entry ends up at after following at most
+        ``max_redirect_hops`` redirects, or None if it isn't redirected.
+        """
+        chain = self.get_redirect_chain(entry)[:self.max_redirect_hops]
+
+        return chain[-1] if chain else None
 
     def add_redirect(
         self,
@@ -339,207 +1078,608 @@ class SQLiteGlossary(Glossary, storage.SQLiteStorage):
         Add redirection from one entry to another.
 
         ``redirect_from`` does not need to exist in the glossary table.
+        ``redirect_to`` may itself be redirected if the chain from
+        ``redirect_from`` stays within ``max_redirect_hops`` and ends at a
+        defined entry, without coming back round to ``redirect_from``.
         """
         redirect_from = redirect_from.lower()
         redirect_to = redirect_to.lower()
+        chain = [redirect_to] + self.get_redirect_chain(redirect_to)
+
+        if not self.get_latest_record(chain[-1]):
+            raise InvalidRedirectError(
+                u'"{}" is not defined'.format(redirect_to)
+            )
+
+        if len(chain) > self.max_redirect_hops:
+            raise InvalidRedirectError(
+                u'"{}" is itself being redirected to "{}."'.format(
+                    redirect_to, chain[1]
+                )
+            )
+
+        if redirect_from in chain:
+            raise InvalidRedirectError(
+                u'"{}" already leads back to "{}."'.format(
+                    redirect_to, redirect_from
+                )
+            )
+
+        sql = """
+            INSERT OR REPLACE INTO glossary_redirects
+              (redirectid, redirect_from, redirect_to)
+            VALUES (
+              (
+                SELECT redirectid from glossary_redirects
+                WHERE redirect_from = ?
+              ),
+              ?,
+              ?
+            )
+        """
+
+        self.write(
+            sql, (redirect_from, redirect_from, redirect_to), redirect_from
+        )
+        self.redirects[redirect_from] = redirect_to
+        self.miss_cache.delete(redirect_from)
+
+    def remove_redirect(self, entry):
+        sql = """
+          DELETE FROM glossary_redirects
+          WHERE redirect_from = ?
+        """
+
+        self.write(sql, (entry.lower(), ), entry)
+        self.redirects.pop(entry.lower(), None)
+
+    def get_redirect(self, entry):
+        redirect_to = self.resolve_redirect(entry)
+
+        if redirect_to:
+            return self.get_latest_record(redirect_to)
+
+        return None
+
+    def resolve_entry(self, entry):
+        """
+        Returns an EntryResolution for an entry: the latest record of its
+        redirect target (or None), and the latest record of the target, or of
+        the entry itself if it isn't redirected (or None if it's undefined).
+
+        Redirects are resolved in memory, so this is at most one query.
+        """
+        redirect_to = self.resolve_redirect(entry)
+        cache_key = (self.LATEST_CACHE_KEY, redirect_to or entry.lower())
+
+        latest = self.cache.get(cache_key, _missing)
+
+        if latest is _missing:
+            latest = self.get_latest_record(redirect_to or entry)
+
+        return EntryResolution(latest if redirect_to else None, latest)
+
+    def add_entry(
+        self,
+        entry,
+        definition,
+        author,
+        channel=None,
+        timestamp=None
+    ):
+        resolution = self.resolve_entry(entry)
+        redirect_entry = resolution.redirect
+
+        if redirect_entry:
+            msg = (
+                u'"{}" redirects to "{}." Redirected entries cannot be defined.'
+            ).format(entry, redirect_entry.entry)
+
+            raise InvalidEntryError(msg)
+
+        if self.write_behind:
+            record = self.queue_entry(
+                resolution.latest, entry, definition, author, channel,
+                timestamp
+            )
+        else:
+            if timestamp:
+                sql = """
+                  INSERT INTO glossary
+                    (entry, entry_lower, definition, author, channel,
+                     timestamp)
+                  VALUES (?, ?, ?, ?, ?, ?)
+                """
+                values = (
+                    entry, entry.lower(), definition, author, channel,
+                    timestamp
+                )
+            else:
+                sql = """
+                  INSERT INTO glossary
+                    (entry, entry_lower, definition, author, channel)
+                  VALUES (?, ?, ?, ?, ?)
+                """
+                values = (entry, entry.lower(), definition, author, channel)
+
+            self.write(sql, values, entry)
+            self.bust_entry_cache(entry)
+
+            record = self.get_latest_record(entry)
+
+        # Patch the all-entries snapshot rather than rebuilding it.
+        with self.lock:
+            if self.snapshot is not None:
+                self.snapshot.upsert(record)
+
+            self.cache.delete(self.COLUMNAR_CACHE_KEY)
+
+            if self.entry_index is not None:
+                self.entry_index.add(record.entry, record.entry_lower)
+
+        # A new name, or a new spelling of one, may be suggested for any miss.
+        if not resolution.latest or resolution.latest.entry != record.entry:
+            self.miss_cache.clear()
+
+        return record
+
+    def queue_entry(
+        self,
+        latest,
+        entry,
+        definition,
+        author,
+        channel=None,
+        timestamp=None
+    ):
+        """
+        Queues a new definition in write-behind mode and returns the entry's
+        latest record as it will be once written.
+
+        ``latest`` is the entry's current latest record, or None. The result
+        is cached so reads see the definition before it's flushed.
+        """
+        if timestamp is None:
+            timestamp = datetime.datetime.utcnow().replace(microsecond=0)
+        elif not isinstance(timestamp, datetime.datetime):
+            timestamp = self.date_str_to_datetime(timestamp)
+
+        epoch = calendar.timegm(timestamp.utctimetuple())
+        count = latest.total_count if latest else 0
+
+        if latest and epoch < latest.timestamp:
+            # An older revision; the current latest stays latest.
+            record = GlossaryRecord(
+                latest.entry, latest.entry_lower, latest.definition,
+                latest.author, latest.channel, latest.timestamp, count,
+                count + 1
+            )
+        else:
+            record = GlossaryRecord(
+                entry, entry.lower(), definition, author, channel, epoch,
+                count, count + 1
+            )
+
+        sql = """
+          INSERT INTO glossary
+            (entry, entry_lower, definition, author, channel, timestamp)
+          VALUES (?, ?, ?, ?, ?, ?)
+        """
+
+        self.write(
+            sql,
+            (entry, entry.lower(), definition, author, channel, timestamp),
+            entry
+        )
+
+        self.bust_entry_cache(entry)
+        self.cache.set((self.LATEST_CACHE_KEY, entry.lower()), record)
+
+        return record
+
+    def add_entries(self, rows, match_timestamp=False):
+        """
+        Add many entries in a single transaction.
+
+        ``rows`` is an iterable of dicts with ``entry``, ``definition`` and
+        ``author`` keys, and optional ``channel`` and ``timestamp`` keys. The
+        timestamp may be a datetime or a dumped epoch string.
+
+        A row is skipped if its entry already has that definition (or, when
+        ``match_timestamp`` is True, the same entry, definition and timestamp),
+        either in the database or earlier in ``rows``. Rows for redirected
+        entries are skipped as well.
+
+        Returns a tuple of (inserted, skipped) lists of rows.
+        """
+        rows = list(rows)
+        inserted, skipped, values = [], [], []
+
+        if not rows:
+            return inserted, skipped
+
+        existing_keys, redirected = self.get_import_conflicts(
+            set(r['entry'].lower() for r in rows), match_timestamp
+        )
+
+        for row in rows:
+            entry = row['entry']
+            timestamp = row.get('timestamp')
+
+            if timestamp is not None and not isinstance(
+                timestamp, datetime.datetime
+            ):
+                timestamp = self.date_str_to_datetime(timestamp)
 
-        if not self.get_latest_record(redirect_to):
-            raise InvalidRedirectError(
-                u'"{}" is not defined'.format(redirect_to)
+            key = self.import_key(
+                entry, row['definition'], timestamp, match_timestamp
             )
 
-        existing = self.get_redirect(redirect_to)
+            if key in existing_keys or entry.lower() in redirected:
+                skipped.append(row)
+                continue
 
-        if existing:
-            raise InvalidRedirectError(
-                u'"{}" is itself being redirected to "{}."'.format(
-                    redirect_to, existing.entry
-                )
-            )
+            existing_keys.add(key)
+            inserted.append(row)
+            values.append((
+                entry,
+                entry.lower(),
+                row['definition'],
+                row['author'],
+                row.get('channel'),
+                timestamp
+            ))
+
+        if not values:
+            return inserted, skipped
 
         sql = """
-            INSERT OR REPLACE INTO glossary_redirects
-              (redirectid, redirect_from, redirect_to)
-            VALUES (
-              (
-                SELECT redirectid from glossary_redirects
-                WHERE redirect_from = ?
-              ),
-              ?,
-              ?
-            )
+          INSERT INTO glossary
+            (entry, entry_lower, definition, author, channel, timestamp)
+          VALUES (?, ?, ?, ?, ?, COALESCE(?, datetime('now','utc')))
         """
 
-        self.db.execute(sql, (redirect_from, redirect_from, redirect_to))
-        self.db.commit()
+        with self.transaction():
+            self.executemany(sql, values)
 
-    def remove_redirect(self, entry):
-        sql = """
-          DELETE FROM glossary_redirects
-          WHERE redirect_from = ?
-        """
+        # Invalidate once for the whole batch.
+        for row in inserted:
+            self.bust_entry_cache(row['entry'])
 
-        self.db.execute(sql, (entry.lower(), ))
-        self.db.commit()
+        self.bust_all_entries_cache()
 
-    def get_redirect(self, entry):
-        sql = """
-            SELECT redirect_to
-            FROM glossary_redirects
-            WHERE redirect_from = ?
-        """
+        return inserted, skipped
 
-        row = self.db.execute(sql, (entry.lower(), )).fetchone()
+    @staticmethod
+    def import_key(entry, definition, timestamp, match_timestamp):
+        """
+        Returns the key ``add_entries`` uses to recognize duplicate rows.
+        """
+        if match_timestamp:
+            if isinstance(timestamp, datetime.datetime):
+                timestamp = calendar.timegm(timestamp.utctimetuple())
 
-        if row:
-            return self.get_latest_record(row[0])
+            return (entry, definition, timestamp)
 
-        return None
+        return (entry.lower(), definition)
 
-    def add_entry(
-        self,
-        entry,
-        definition,
-        author,
-        channel=None,
-        timestamp=None
-    ):
-        redirect_entry = self.get_redirect(entry)
+    def get_import_conflicts(self, entry_lowers, match_timestamp=False):
+        """
+        Returns the existing import keys for the given entries, and a dict
+        mapping those entries that are redirected to their targets.
 
-        if redirect_entry:
-            msg = (
-                u'"{}" redirects to "{}." Redirected entries cannot be defined.'
-            ).format(entry, redirect_entry.entry)
+        Uses a temporary table so the keys are a single set-based query.
+        """
+        self.execute("""
+          CREATE TEMP TABLE IF NOT EXISTS glossary_import_keys (
+            entry_lower VARCHAR PRIMARY KEY
+          )
+        """)
+        self.execute('DELETE FROM temp.glossary_import_keys')
+        self.executemany(
+            'INSERT INTO temp.glossary_import_keys VALUES (?)',
+            [(e, ) for e in entry_lowers]
+        )
 
-            raise InvalidEntryError(msg)
+        entries_sql = """
+          SELECT entry, definition, strftime('%s', timestamp)
+          FROM glossary
+          WHERE entry_lower IN (
+            SELECT entry_lower FROM temp.glossary_import_keys
+          )
+        """
 
-        if timestamp:
-            sql = """
-              INSERT INTO glossary
-                (entry, entry_lower, definition, author, channel, timestamp)
-              VALUES (?, ?, ?, ?, ?, ?)
-            """
-            values = (
-                entry, entry.lower(), definition, author, channel, timestamp
-            )
-        else:
-            sql = """
-              INSERT INTO glossary
-                (entry, entry_lower, definition, author, channel)
-              VALUES (?, ?, ?, ?, ?)
-            """
-            values = (entry, entry.lower(), definition, author, channel)
+        existing = set(
+            self.import_key(row[0], row[1], int(row[2]), match_timestamp)
+            for row in self.execute(entries_sql)
+        )
 
-        self.db.execute(sql, values)
-        self.db.commit()
-        self.bust_all_entries_cache()
+        redirected = dict(
+            (e, self.redirects[e]) for e in entry_lowers if e in self.redirects
+        )
 
-        return self.get_latest_record(entry)
+        return existing, redirected
 
     def get_all_records(self):
         """
         Returns list of all the latest entries in the glossary.
-        """
-        cache_key = 'all_entries'
-        entries = self.cache.get(cache_key)
 
-        if entries is None:
-            sql = """
-              SELECT entry,
-                entry_lower,
-                definition,
-                author,
-                channel,
-                strftime('%s', timestamp),
-                COUNT(entry_lower)
-              FROM glossary
-              GROUP BY entry_lower
-              ORDER BY timestamp
-            """
+        The list is shared with the store and sorted by ``entry_lower``;
+        callers should not modify it.
+        """
+        with self.lock:
+            if self.snapshot is None:
+                sql = """
+                  SELECT g.entry,
+                    g.entry_lower,
+                    g.definition,
+                    g.author,
+                    g.channel,
+                    CAST(strftime('%s', g.timestamp) AS INTEGER),
+                    l.total_count
+                  FROM glossary_latest l
+                  JOIN glossary g ON g.entryid = l.entryid
+                  ORDER BY l.entry_lower
+                """
+
+                entries = []
+
+                # Authors and channels repeat across entries, so each distinct
+                # value is stored once and shared by its records.
+                shared = {}
+
+                for row in self.execute(sql):
+                    record = self.latest_row_to_record(row)
+                    record.author = shared.setdefault(
+                        record.author, record.author
+                    )
+                    record.channel = shared.setdefault(
+                        record.channel, record.channel
+                    )
+                    entries.append(record)
 
-            query = self.db.execute(sql).fetchall()
-            entries = []
+                self.snapshot = EntrySnapshot(entries)
 
-            for row in query:
-                count = row[-1]
-                record = GlossaryRecord(
-                    row[0],
-                    row[1],
-                    row[2],
-                    row[3],
-                    row[4],
-                    datetime.datetime.utcfromtimestamp(int(row[5])),
-                    count - 1,
-                    count
-                )
+            return self.snapshot.records
 
-                entries.append(record)
+    def get_columnar_snapshot(self):
+        """
+        Returns a ColumnarSnapshot of the latest entries, for reporting.
 
-            entries.sort(key=lambda x: x.entry_lower)
+        Requires numpy; raises ImportError without it.
+        """
+        with self.lock:
+            snapshot = self.cache.get(self.COLUMNAR_CACHE_KEY)
 
-            self.cache[cache_key] = entries
+            if snapshot is None:
+                snapshot = ColumnarSnapshot(self.get_all_records())
+                self.cache.set(self.COLUMNAR_CACHE_KEY, snapshot)
 
-        return entries
+        return snapshot
 
     def get_random_entry(self):
         """
         Returns a random entry from the glossary.
+
+        Picks a random point in glossary_latest's rowid range and takes the
+        first entry at or after it, so the cost doesn't depend on the size of
+        the glossary. Entries following a gap left by deleted rows are
+        slightly more likely to be picked.
+        """
+        sql = """
+            SELECT g.entry
+            FROM glossary_latest l
+            JOIN glossary g ON g.entryid = l.entryid
+            WHERE l.rowid >= (SELECT MIN(rowid) FROM glossary_latest) + CAST(
+              ? * (
+                (SELECT MAX(rowid) FROM glossary_latest) -
+                (SELECT MIN(rowid) FROM glossary_latest) + 1
+              ) AS INTEGER
+            )
+            ORDER BY l.rowid
+            LIMIT 1
         """
-        entries = self.get_all_records()
 
-        if not entries:
-            return None
+        row = self.execute(sql, (random.random(), )).fetchone()
 
-        return random.choice(entries).entry
+        return row[0] if row else None
+
+    def latest_row_to_record(self, row):
+        """
+        Builds a GlossaryRecord from an entry row followed by its total count.
+        """
+        count = row[6]
+
+        return GlossaryRecord(
+            row[0],
+            row[1],
+            row[2],
+            row[3],
+            row[4],
+            row[5],
+            count - 1,
+            count
+        )
 
     def get_latest_record(self, entry):
         """
         Returns GlossaryQueryResult for an entry in the glossary.
         """
-        records = self.get_all_records_for_entry(entry)
+        entry = entry.lower()
+        cache_key = (self.LATEST_CACHE_KEY, entry)
+        record = self.cache.get(cache_key, _missing)
 
-        if not records:
-            return None
+        if record is not _missing:
+            return record
+
+        sql = """
+            SELECT g.entry,
+              g.entry_lower,
+              g.definition,
+              g.author,
+              g.channel,
+              CAST(strftime('%s', g.timestamp) AS INTEGER),
+              l.total_count
+            FROM glossary_latest l
+            JOIN glossary g ON g.entryid = l.entryid
+            WHERE l.entry_lower = ?
+        """
+
+        row = self.execute(
+            sql, (entry, ), flush=self.is_dirty(entry)
+        ).fetchone()
+        record = self.latest_row_to_record(row) if row else None
 
-        return records[-1]
+        self.cache.set(cache_key, record)
 
-    def get_nth_record(self, entry, num, follow_redirect=True):
+        return record
+
+    def get_latest_records(self, entries):
         """
-        Returns GlossaryQueryResult for nth entry in the glossary.
+        Returns a dict mapping each entry's entry_lower to its latest record,
+        or to None if it's undefined.
+
+        Entries missing from the cache are fetched together, one query per
+        ``IN_CHUNK_SIZE`` of them.
         """
-        redirect = Glossary.store.get_redirect(entry)
-        target_entry = redirect.entry if redirect else entry
+        records = {}
+        uncached = []
 
-        try:
-            query_result = Glossary.store.get_entry_data(target_entry, num)
-        except IndexError:
-            entries = Glossary.store.get_all_records_for_entry(target_entry)
+        for entry in entries:
+            entry_lower = entry.lower()
+            cache_key = (self.LATEST_CACHE_KEY, entry_lower)
+
+            if entry_lower in records:
+                continue
+
+            record = self.cache.get(cache_key, _missing)
+
+            if record is _missing:
+                records[entry_lower] = None
+                uncached.append(entry_lower)
+            else:
+                records[entry_lower] = record
+
+        sql = """
+            SELECT g.entry,
+              g.entry_lower,
+              g.definition,
+              g.author,
+              g.channel,
+              CAST(strftime('%s', g.timestamp) AS INTEGER),
+              l.total_count
+            FROM glossary_latest l
+            JOIN glossary g ON g.entryid = l.entryid
+            WHERE l.entry_lower IN ({})
+        """
+
+        for i in range(0, len(uncached), self.IN_CHUNK_SIZE):
+            chunk = uncached[i:i + self.IN_CHUNK_SIZE]
+            rows = self.execute(
+                sql.format(', '.join('?' * len(chunk))),
+                chunk,
+                flush=any(self.is_dirty(e) for e in chunk)
+            ).fetchall()
+
+            for row in rows:
+                record = self.latest_row_to_record(row)
+                records[record.entry_lower] = record
+
+        for entry_lower in uncached:
+            self.cache.set(
+                (self.LATEST_CACHE_KEY, entry_lower), records[entry_lower]
+            )
+
+        return records
+
+    def resolve_entries(self, entries):
+        """
+        Returns an EntryResolution for each entry, like ``resolve_entry``,
+        with a single query for all of them.
+        """
+        targets = [self.resolve_redirect(entry) for entry in entries]
+        records = self.get_latest_records(
+            target or entry for entry, target in zip(entries, targets)
+        )
 
-            if not entries:
-                return UNDEFINED_TEMPLATE.format(entry)
+        resolutions = []
 
-            raise InvalidEntryNumberError(entry, entries, redirect)
+        for entry, target in zip(entries, targets):
+            latest = records[(target or entry).lower()]
+            resolutions.append(
+                EntryResolution(latest if target else None, latest)
+            )
 
+        return resolutions
 
-        # Entry numbering starts at 1
-        if num is not None and num < 1:
-            raise IndexError
+    def get_nth_record(self, entry, num):
+        """
+        Returns the GlossaryRecord for the ``num``th definition of an entry,
+        counting from 1, or None if there is no such definition.
 
-        stored = self.get_all_records_for_entry(entry)
+        Only the requested revision is fetched, so the cost doesn't grow with
+        the entry's history.
+        """
+        entry = entry.lower()
 
-        if not stored:
+        if num < 1:
             return None
 
-        if num:
-            return stored[num - 1]
+        cache_key = (self.REVISIONS_CACHE_KEY, entry)
+        revisions = self.cache.get(cache_key)
+
+        if revisions is None:
+            revisions = {}
+            self.cache.set(cache_key, revisions)
+        elif num in revisions:
+            return revisions[num]
 
-        return stored[-1]
+        sql = """
+            SELECT g.entry,
+              g.entry_lower,
+              g.definition,
+              g.author,
+              g.channel,
+              CAST(strftime('%s', g.timestamp) AS INTEGER),
+              l.total_count
+            FROM glossary g
+            JOIN glossary_latest l ON l.entry_lower = g.entry_lower
+            WHERE g.entry_lower = ?
+            ORDER BY g.timestamp, g.entryid
+            LIMIT 1 OFFSET ?
+        """
+
+        row = self.execute(
+            sql, (entry, num - 1), flush=self.is_dirty(entry)
+        ).fetchone()
+        record = None
+
+        if row:
+            record = GlossaryRecord(
+                row[0],
+                row[1],
+                row[2],
+                row[3],
+                row[4],
+                row[5],
+                num - 1,
+                row[6]
+            )
+
+        revisions[num] = record
+
+        return record
 
     def get_all_records_for_entry(self, entry):
         """
         Returns a list of objects for all definitions of an entry.
         """
         entry = entry.lower()
+        cache_key = (self.RECORDS_CACHE_KEY, entry)
+        entry_data = self.cache.get(cache_key)
+
+        if entry_data is not None:
+            return entry_data
 
         sql = """
             SELECT entry,
@@ -547,63 +1687,262 @@ class SQLiteGlossary(Glossary, storage.SQLiteStorage):
               definition,
               author,
               channel,
-              strftime('%s', timestamp)
+              CAST(strftime('%s', timestamp) AS INTEGER)
             FROM glossary
-            WHERE entry_lower LIKE ?
-            ORDER BY timestamp
+            WHERE entry_lower = ?
+            ORDER BY timestamp, entryid
         """
 
-        results = self.db.execute(sql, (entry, )).fetchall()
+        results = self.execute(
+            sql, (entry, ), flush=self.is_dirty(entry)
+        ).fetchall()
+        entry_data = self.rows_to_records(results)
+
+        self.cache.set(cache_key, entry_data)
+
+        return entry_data
 
-        entry_data = []
-        total_count = len(results)
+    def rows_to_records(self, rows):
+        """
+        Builds GlossaryRecords from an entry's revision rows, oldest first.
+        """
+        records = []
+        total_count = len(rows)
 
-        for i, row in enumerate(results):
-            entry_data.append(
+        for i, row in enumerate(rows):
+            records.append(
                 GlossaryRecord(
                     row[0],
                     row[1],
                     row[2],
                     row[3],
                     row[4],
-                    self.date_str_to_datetime(row[5]),
+                    row[5],
                     i,
                     total_count
                 )
             )
 
-        return entry_data
+        return records
+
+    def get_entry_index(self):
+        with self.lock:
+            if self.entry_index is None:
+                self.entry_index = NgramIndex(self.get_all_records())
+
+            return self.entry_index
 
     def get_similar_words(self, search_str):
-        search_str = search_str.lower()
-        all_entries = self.get_all_records()
+        """
+        Returns entries whose names contain the search string.
+        """
+        with self.lock:
+            return self.get_entry_index().search(search_str)
+
+    def iter_entries_with_prefix(self, prefix):
+        """
+        Yields entries whose names start with the prefix, in order.
+        """
+        return self.get_entry_index().iter_prefix(prefix)
+
+    def get_cached_suggestions(self, entry):
+        """
+        Returns the suggestions cached for an undefined entry, or None.
+        """
+        return self.miss_cache.get(entry.lower())
+
+    def cache_suggestions(self, entry, suggestions):
+        self.miss_cache.set(entry.lower(), suggestions)
+
+    def get_fuzzy_matches(self, search_str, limit=None, budget=None):
+        """
+        Returns entries within a few edits of the search string, closest
+        first.
 
-        matches = [e.entry for e in all_entries if search_str in e.entry_lower]
+        Queries shorter than three characters get no matches. Up to 8
+        characters allow one edit, longer queries two. Stops looking after
+        ``budget`` seconds and returns what it has found so far.
+        """
+        if len(search_str) < 3:
+            return []
+
+        deadline = time.time() + budget if budget is not None else None
+        max_distance = 1 if len(search_str) <= 8 else 2
+
+        with self.lock:
+            matches = self.get_entry_index().fuzzy_search(
+                search_str, max_distance, limit=limit, deadline=deadline
+            )
 
-        return matches
+        return [entry for distance, entry in matches]
 
-    def search_definitions(self, search_str):
+    def search_definitions(self, search_str, include_history=False):
         """
         Returns entries whose definitions contain the search string.
+
+        Only current definitions are searched unless ``include_history`` is
+        True. Uses the full-text index when available, best matches first.
         """
+        if self.fts_enabled and len(search_str) >= self.FTS_MIN_SEARCH_LENGTH:
+            return self.search_definitions_fts(search_str, include_history)
+
         search_str = '%{}%'.format(search_str)
 
-        sql = """
-            SELECT DISTINCT entry
-            FROM glossary
-            WHERE definition LIKE ?
-            ORDER BY entry
-        """
+        if include_history:
+            sql = """
+                SELECT DISTINCT entry
+                FROM glossary
+                WHERE definition LIKE ?
+                ORDER BY entry
+            """
+        else:
+            sql = """
+                SELECT g.entry
+                FROM glossary_latest l
+                JOIN glossary g ON g.entryid = l.entryid
+                WHERE g.definition LIKE ?
+                ORDER BY g.entry
+            """
 
-        results = self.db.execute(sql, (search_str, ))
+        results = self.execute(sql, (search_str, ))
 
         return [r[0] for r in results]
 
+    def search_definitions_fts(self, search_str, include_history=False):
+        """
+        Returns entries whose definitions contain the search string, ranked
+        by the full-text index.
+        """
+        # Quote the search string so FTS treats it as a single phrase.
+        match = u'"{}"'.format(search_str.replace('"', '""'))
 
-GlossaryRecord = namedtuple(
-    'GlossaryQueryResult',
-    'entry entry_lower definition author channel datetime index total_count'
-)
+        if include_history:
+            sql = """
+                SELECT g.entry
+                FROM glossary_fts
+                JOIN glossary g ON g.entryid = glossary_fts.rowid
+                WHERE glossary_fts MATCH ?
+                ORDER BY glossary_fts.rank
+            """
+        else:
+            sql = """
+                SELECT g.entry
+                FROM glossary_fts
+                JOIN glossary_latest l ON l.entryid = glossary_fts.rowid
+                JOIN glossary g ON g.entryid = l.entryid
+                WHERE glossary_fts MATCH ?
+                ORDER BY glossary_fts.rank
+            """
+
+        results, seen = [], set()
+
+        for row in self.execute(sql, (match, )):
+            if row[0] not in seen:
+                seen.add(row[0])
+                results.append(row[0])
+
+        return results
+
+
+class GlossaryRecord(object):
+    """
+    One revision of an entry.
+
+    The snapshot holds one of these per entry, so the timestamp is kept as
+    epoch seconds and only turned into a ``datetime`` on access. Iterating,
+    comparing and hashing behave like the namedtuple this used to be.
+    """
+    __slots__ = (
+        'entry', 'entry_lower', 'definition', 'author', 'channel', 'timestamp',
+        'index', 'total_count',
+    )
+
+    _fields = (
+        'entry', 'entry_lower', 'definition', 'author', 'channel', 'datetime',
+        'index', 'total_count',
+    )
+
+    def __init__(
+        self,
+        entry,
+        entry_lower,
+        definition,
+        author,
+        channel,
+        timestamp,
+        index,
+        total_count
+    ):
+        self.entry = entry
+        # Most entries are already lowercase; share the string if so.
+        self.entry_lower = entry if entry == entry_lower else entry_lower
+        self.definition = definition
+        self.author = author
+        self.channel = channel
+        self.timestamp = int(timestamp)
+        self.index = index
+        self.total_count = total_count
+
+    @property
+    def datetime(self):
+        return datetime.datetime.utcfromtimestamp(self.timestamp)
+
+    def __iter__(self):
+        return (getattr(self, field) for field in self._fields)
+
+    def __eq__(self, other):
+        if not isinstance(other, GlossaryRecord):
+            return NotImplemented
+
+        return tuple(self) == tuple(other)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+
+        if result is NotImplemented:
+            return result
+
+        return not result
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __repr__(self):
+        return 'GlossaryRecord({})'.format(', '.join(
+            '{}={!r}'.format(field, value)
+            for field, value in zip(self._fields, self)
+        ))
+
+
+EntryResolution = namedtuple('EntryResolution', 'redirect latest')
+
+
+class EntrySnapshot(object):
+    """
+    The latest record of every entry, kept sorted by ``entry_lower``.
+
+    ``upsert`` lets writes patch a single entry in place, so the snapshot
+    never needs a full rebuild after a definition is added.
+    """
+    def __init__(self, records):
+        self.records = sorted(records, key=lambda r: r.entry_lower)
+        self.keys = [r.entry_lower for r in self.records]
+
+    def __len__(self):
+        return len(self.records)
+
+    def upsert(self, record):
+        """
+        Replaces the record for ``record.entry_lower``, or inserts it in order.
+        """
+        key = record.entry_lower
+        i = bisect.bisect_left(self.keys, key)
+
+        if i < len(self.keys) and self.keys[i] == key:
+            self.records[i] = record
+        else:
+            self.keys.insert(i, key)
+            self.records.insert(i, record)
 
 
 class QueryHandler(object):
@@ -614,18 +1953,18 @@ class QueryHandler(object):
     def __init__(self, entry, num=None):
         self.entry = entry
         self.num = num
-        self.redirect = Glossary.store.get_redirect(entry)
+
+        resolution = Glossary.store.resolve_entry(entry)
+        self.redirect = resolution.redirect
+        self.latest = resolution.latest
+        self.count = self.latest.total_count if self.latest else 0
 
         if self.redirect:
             self.target_entry = self.redirect.entry
         else:
             self.target_entry = self.entry
 
-        self.records = Glossary.store.get_all_records_for_entry(
-            self.target_entry
-        )
-
-        self.success = bool(self.records) and self.num_is_valid
+        self.success = bool(self.count) and self.num_is_valid
 
     def response(self):
         if not self.success:
@@ -652,10 +1991,10 @@ class QueryHandler(object):
 
         message = None
 
-        if not self.records:
+        if not self.count:
             message = u'"{}" is undefined'.format(self.entry)
             # Check if there are any similar entries that may be relevant.
-            suggestions = list(get_alternative_suggestions(self.entry))[:10]
+            suggestions = get_suggestions(self.entry)
 
             if suggestions:
                 message += (
@@ -663,9 +2002,9 @@ class QueryHandler(object):
                 )
 
         elif not self.num_is_valid:
-            message = unicode(
+            message = u'{}'.format(
                 InvalidEntryNumberError(
-                    self.entry, self.records, self.redirect
+                    self.entry, self.count, self.redirect
                 )
             )
 
@@ -673,22 +2012,22 @@ class QueryHandler(object):
 
     @property
     def target_record(self):
-        if self.num:
+        if self.num and self.num != self.count:
             if not self.num_is_valid:
                 raise InvalidEntryNumberError(
-                    self.entry, self.records, self.redirect
+                    self.entry, self.count, self.redirect
                 )
 
-            return self.records[self.num - 1]
+            return Glossary.store.get_nth_record(self.target_entry, self.num)
 
-        return self.records[-1]
+        return self.latest
 
     @property
     def num_is_valid(self):
         if self.num is None:
             return True
 
-        return 1 <= self.num <= len(self.records)
+        return 1 <= self.num <= self.count
 
 
 class WhoWroteHandler(QueryHandler):
@@ -696,15 +2035,17 @@ class WhoWroteHandler(QueryHandler):
         if not self.success:
             return self.error_response()
 
+        target_record = self.target_record
+
         response = u'{} authored the {} definition of {}.'.format(
-            self.target_record.author,
-            nth_str(self.target_record.index + 1),
-            self.target_record.entry
+            target_record.author,
+            nth_str(target_record.index + 1),
+            target_record.entry
         )
 
         if self.redirect:
             response = u'{} redirects to {}. {}'.format(
-                self.entry, self.target_record.entry, response
+                self.entry, target_record.entry, response
             )
 
         return response
@@ -771,28 +2112,93 @@ def readable_join(items, conjunction='or'):
     return s
 
 
-def get_alternative_suggestions(entry):
+def suggestion_words(entry):
     """
-    Returns a set of entries that may be similar to the provided entry.
-
-    Useful for trying to find near misses. E.g., "run" is not defined but
-    "running" is.
+    Returns the lowercased entry, then its words split on spaces, dashes and
+    underscores, in order and without repeats.
     """
-    query_words = set()
+    words = [entry.lower()]
 
     for delim in (' ', '-', '_'):
-        for part in entry.split(delim):
-            query_words.add(part.strip().lower())
+        for part in entry.lower().split(delim):
+            part = part.strip()
+
+            if part and part not in words:
+                words.append(part)
+
+    return words
+
+
+def iter_word_matches(entry):
+    """
+    Yields entries sharing a word with the provided entry: for each word,
+    those starting with it, then (for words of ``MIN_SUBSTRING_LENGTH`` or
+    more) those containing it. May repeat entries.
+    """
+    for word in suggestion_words(entry):
+        for match in Glossary.store.iter_entries_with_prefix(word):
+            yield match
+
+        if len(word) >= MIN_SUBSTRING_LENGTH:
+            for match in Glossary.store.get_similar_words(word):
+                yield match
+
+
+def iter_suggestions(entry, limit=SUGGESTION_LIMIT, deadline=None):
+    """
+    Yields entries the user may have meant by an undefined entry, best
+    first: near misspellings, closest first, then ``iter_word_matches``.
+
+    Candidates are produced lazily, so taking a few only does the work for
+    those. Stops once ``time.time()`` passes ``deadline``.
+    """
+    budget = deadline - time.time() if deadline is not None else None
+    candidates = itertools.chain(
+        Glossary.store.get_fuzzy_matches(entry, limit=limit, budget=budget),
+        iter_word_matches(entry),
+    )
+    seen = set()
+
+    for candidate in candidates:
+        if deadline is not None and time.time() > deadline:
+            return
+
+        if candidate not in seen:
+            seen.add(candidate)
+            yield candidate
+
+
+def get_suggestions(entry):
+    """
+    Returns up to ``SUGGESTION_LIMIT`` suggestions for an undefined entry,
+    spending at most ``glossary_suggestion_budget`` seconds finding them.
+
+    These are cached until an entry name is added, unless the budget ran out
+    first and the list may be incomplete.
+    """
+    suggestions = Glossary.store.get_cached_suggestions(entry)
+
+    if suggestions is None:
+        budget = float(get_config('glossary_suggestion_budget', 0.05))
+        deadline = time.time() + budget
+        suggestions = list(itertools.islice(
+            iter_suggestions(entry, deadline=deadline), SUGGESTION_LIMIT
+        ))
 
-    results = set()
+        if time.time() < deadline:
+            Glossary.store.cache_suggestions(entry, suggestions)
 
-    for word in query_words:
-        similar = Glossary.store.get_similar_words(word)
+    return suggestions
 
-        if similar:
-            results |= set(similar)
 
-    return results
+def get_alternative_suggestions(entry):
+    """
+    Returns a set of entries that may be similar to the provided entry.
+
+    Useful for trying to find near misses. E.g., "run" is not defined but
+    "running" is. Use ``get_suggestions`` for a ranked, capped list.
+    """
+    return set(iter_word_matches(entry))
 
 
 def handle_nth_definition(entry, num=None):
@@ -813,7 +2219,7 @@ def handle_nth_definition(entry, num=None):
         if not entries:
             return UNDEFINED_TEMPLATE.format(entry)
 
-        raise InvalidEntryNumberError(entry, entries, redirect)
+        raise InvalidEntryNumberError(entry, len(entries), redirect)
 
     if query_result:
         kwargs = dict(
@@ -834,7 +2240,7 @@ def handle_nth_definition(entry, num=None):
     response = UNDEFINED_TEMPLATE.format(entry)
 
     # Check if there are any similar entries that may be relevant.
-    suggestions = list(get_alternative_suggestions(entry))[:10]
+    suggestions = get_suggestions(entry)
 
     if suggestions:
         response += (
@@ -898,6 +2304,7 @@ def nth_str(num):
 @override_command(
     DEFINE_COMMAND, doc=HELP_DEFINE_STR, aliases=('set', 'gdefine')
 )
+@stats.timed('command.define')
 def define(client, event, channel, nick, rest):
     """
     Add a definition for a glossary entry.
@@ -947,6 +2354,7 @@ def define(client, event, channel, nick, rest):
 
 
 @command(QUERY_COMMAND, doc=DOCS_STR)
+@stats.timed('command.query_command')
 @entry_number_command(accepts_num=True, docs=HELP_QUERY_STR)
 def query_command(entry, num):
     """
@@ -956,10 +2364,57 @@ def query_command(entry, num):
         entry = Glossary.store.get_random_entry()
         num = None
 
+    if ',' in entry:
+        if num is not None:
+            return HELP_QUERY_STR
+
+        return batch_query(entry.split(','))
+
     return QueryHandler(entry, num).response()
 
 
+def batch_query(entries):
+    """
+    Returns the current definitions of several entries on one line.
+    """
+    unique, seen = [], set()
+
+    for entry in entries:
+        entry = entry.strip()
+
+        if entry and entry.lower() not in seen:
+            seen.add(entry.lower())
+            unique.append(entry)
+
+    if not unique:
+        return HELP_QUERY_STR
+
+    if len(unique) > BATCH_QUERY_LIMIT:
+        return u'I can only look up {} entries at a time.'.format(
+            BATCH_QUERY_LIMIT
+        )
+
+    results = []
+
+    for entry, resolution in zip(
+        unique, Glossary.store.resolve_entries(unique)
+    ):
+        latest = resolution.latest
+
+        if not latest:
+            results.append(u'"{}" is undefined'.format(entry))
+        elif resolution.redirect:
+            results.append(u'{} (redirects to {}): {}'.format(
+                entry, latest.entry, latest.definition
+            ))
+        else:
+            results.append(u'{}: {}'.format(latest.entry, latest.definition))
+
+    return u' | '.join(results)
+
+
 @command(REDIRECT_COMMAND)
+@stats.timed('command.redirect_command')
 def redirect_command(client, event, channel, nick, rest):
     """
     Redirect one entry to another.
@@ -983,6 +2438,7 @@ def redirect_command(client, event, channel, nick, rest):
 
 
 @command(REMOVE_REDIRECT_COMMAND)
+@stats.timed('command.remove_redirect')
 @entry_number_command(
     accepts_num=False, require_entry=True, docs=HELP_REMOVE_REDIRECT_STR
 )
@@ -990,19 +2446,22 @@ def remove_redirect(entry):
     """
     Remove a redirect.
     """
-    existing = Glossary.store.get_redirect(entry)
+    # Report the direct target, not where a longer chain ends up.
+    redirect_to = Glossary.store.redirects.get(entry.lower())
 
-    if not existing:
-        return u'"{}" is not being redirected anywhere.'
+    if not redirect_to:
+        return u'"{}" is not being redirected anywhere.'.format(entry)
 
+    existing = Glossary.store.get_latest_record(redirect_to)
     Glossary.store.remove_redirect(entry)
 
     return u'"{}" is no longer being redirected to "{}"'.format(
-        entry, existing.entry
+        entry, existing.entry if existing else redirect_to
     )
 
 
 @command(SEARCH_COMMAND, doc=DOCS_STR)
+@stats.timed('command.search')
 @entry_number_command(
     accepts_num=False, require_entry=True, docs=HELP_SEARCH_STR
 )
@@ -1031,6 +2490,7 @@ def search(entry):
 
 
 @command(WHOWROTE_COMMAND, doc=HELP_WHOWROTE_STR)
+@stats.timed('command.who_wrote')
 @entry_number_command(
     accepts_num=True, require_entry=True, docs=HELP_WHOWROTE_STR
 )
@@ -0,0 +1,224 @@
+import bisect
+import time
+from collections import defaultdict
+
+
+def edit_distance(a, b, limit=None):
+    """
+    Returns the Levenshtein distance between ``a`` and ``b``.
+
+    If ``limit`` is given, gives up as soon as the distance is known to
+    exceed it and returns ``limit + 1``.
+    """
+    if len(a) < len(b):
+        a, b = b, a
+
+    if limit is not None and len(a) - len(b) > limit:
+        return limit + 1
+
+    previous = list(range(len(b) + 1))
+
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+
+        for j, char_b in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b),
+            ))
+
+        if limit is not None and min(current) > limit:
+            return limit + 1
+
+        previous = current
+
+    return previous[-1]
+
+
+class NgramIndex(object):
+    """
+    An in-memory n-gram posting-list index for substring matching on entries.
+
+    Every entry_lower is indexed under each of its substrings of length 1 to
+    ``n``. A query no longer than ``n`` is answered straight from its posting
+    list; a longer query intersects the posting lists of its n-grams and only
+    verifies the (usually tiny) candidate set.
+
+    A sorted list of the entry_lowers also answers prefix queries lazily.
+    """
+    def __init__(self, records=(), n=3):
+        self.n = n
+        self.postings = defaultdict(set)
+
+        # Maps entry_lower to the entry's display form.
+        self.entries = {}
+        self.keys = []
+
+        # Maps a length to the entry_lowers of that length.
+        self.lengths = defaultdict(set)
+
+        for record in records:
+            self.add(record.entry, record.entry_lower)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def grams(self, s):
+        """
+        Returns the set of substrings of ``s`` with length 1 to ``n``.
+        """
+        grams = set()
+
+        for size in range(1, self.n + 1):
+            for i in range(len(s) - size + 1):
+                grams.add(s[i:i + size])
+
+        return grams
+
+    def add(self, entry, entry_lower=None):
+        """
+        Indexes an entry, or updates the display form of an indexed one.
+        """
+        entry_lower = entry_lower or entry.lower()
+        is_new = entry_lower not in self.entries
+
+        # Set before the key is listed, so a running ``iter_prefix`` never
+        # finds a key without its entry.
+        self.entries[entry_lower] = entry
+
+        if is_new:
+            for gram in self.grams(entry_lower):
+                self.postings[gram].add(entry_lower)
+
+            bisect.insort(self.keys, entry_lower)
+            self.lengths[len(entry_lower)].add(entry_lower)
+
+    def iter_prefix(self, prefix):
+        """
+        Yields display entries starting with ``prefix``, ordered by
+        entry_lower.
+        """
+        prefix = prefix.lower()
+
+        for i in range(bisect.bisect_left(self.keys, prefix), len(self.keys)):
+            if not self.keys[i].startswith(prefix):
+                break
+
+            yield self.entries[self.keys[i]]
+
+    def candidates(self, search_str):
+        """
+        Returns entry_lowers that may contain ``search_str``.
+
+        For queries of length ``n`` or less the result is exact.
+        """
+        if not search_str:
+            return set(self.entries)
+
+        if len(search_str) <= self.n:
+            return self.postings.get(search_str, set())
+
+        grams = set(
+            search_str[i:i + self.n]
+            for i in range(len(search_str) - self.n + 1)
+        )
+        postings = sorted(
+            (self.postings.get(gram, set()) for gram in grams), key=len
+        )
+
+        result = set(postings[0])
+
+        for posting in postings[1:]:
+            if not result:
+                break
+
+            result &= posting
+
+        return result
+
+    def search(self, search_str):
+        """
+        Returns display entries containing ``search_str``, ordered by
+        entry_lower.
+        """
+        search_str = search_str.lower()
+
+        matches = [
+            e for e in self.candidates(search_str) if search_str in e
+        ]
+
+        return [self.entries[e] for e in sorted(matches)]
+
+    def fuzzy_search(self, query, max_distance, limit=None, deadline=None):
+        """
+        Returns (distance, entry) pairs for the entries within
+        ``max_distance`` edits of ``query``, closest first and then by
+        entry_lower.
+
+        An edit changes at most ``size`` of a string's substrings of length
+        ``size``, so a match must share all but ``max_distance * size`` of
+        the query's distinct grams, and so appear in at least one of that
+        many plus one of their posting lists. Candidates are drawn from the
+        shortest of those lists for whichever gram size gives the fewest, or
+        from the entries of about the query's length if there are fewer of
+        them, counted against the posting lists, and only the survivors have
+        their edit distance computed.
+
+        Stops verifying candidates once ``time.time()`` passes ``deadline``,
+        returning what it has found so far.
+        """
+        query = query.lower()
+        postings = []
+        needed = 0
+
+        candidates = [
+            self.lengths.get(length, set())
+            for length in range(
+                len(query) - max_distance, len(query) + max_distance + 1
+            )
+        ]
+
+        for size in range(1, self.n + 1):
+            grams = set(
+                query[i:i + size] for i in range(len(query) - size + 1)
+            )
+
+            if len(grams) - max_distance * size < 1:
+                continue
+
+            size_postings = sorted(
+                (self.postings.get(gram, set()) for gram in grams), key=len
+            )
+            size_needed = len(grams) - max_distance * size
+            required = size_postings[:len(grams) - size_needed + 1]
+
+            if sum(map(len, required)) < sum(map(len, candidates)):
+                postings, needed = size_postings, size_needed
+                candidates = required
+
+        matches = []
+
+        for candidate in set().union(*candidates):
+            if deadline is not None and time.time() > deadline:
+                break
+
+            if abs(len(candidate) - len(query)) > max_distance:
+                continue
+
+            shared = sum(1 for posting in postings if candidate in posting)
+
+            if shared < needed:
+                continue
+
+            distance = edit_distance(query, candidate, max_distance)
+
+            if distance <= max_distance:
+                matches.append((distance, candidate))
+
+        matches.sort()
+
+        return [
+            (distance, self.entries[entry_lower])
+            for distance, entry_lower in matches[:limit]
+        ]
@@ -0,0 +1,329 @@
+"""
+In-process counters and histograms for the glossary's commands and store.
+
+Wrap a function with ``timed`` to record its calls, errors and wall time,
+plus the SQL statements, rows fetched and cache hits/misses that happen
+while it runs (nested timed calls count toward every enclosing one).
+
+Set ``registry.enabled`` to False before the instrumented modules are
+imported to leave their functions unwrapped and record nothing.
+"""
+import bisect
+import functools
+import inspect
+import json
+import threading
+import time
+import timeit
+from collections import defaultdict
+
+# Upper bounds for the histogram buckets. The last bucket is unbounded.
+MS_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 100, 1000, 10000)
+
+# Per-call quantities tracked by ``timed``, and their histogram buckets.
+TRACKED = (
+    ('sql', COUNT_BUCKETS),
+    ('rows', COUNT_BUCKETS),
+    ('cache_hits', COUNT_BUCKETS),
+    ('cache_misses', COUNT_BUCKETS),
+)
+
+
+class Histogram(object):
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+
+        if self.min is None or value < self.min:
+            self.min = value
+
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, pct):
+        """
+        Returns the upper bound of the bucket holding the given percentile,
+        or the max for the unbounded bucket.
+        """
+        if not self.count:
+            return None
+
+        threshold = pct / 100.0 * self.count
+        seen = 0
+
+        for i, count in enumerate(self.counts):
+            seen += count
+
+            if seen >= threshold and count:
+                if i < len(self.buckets):
+                    return min(self.buckets[i], self.max)
+
+                return self.max
+
+        return self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'total': self.total,
+            'mean': float(self.total) / self.count if self.count else None,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p99': self.percentile(99),
+            'buckets': dict(
+                (str(bound), count)
+                for bound, count in zip(self.buckets + ('inf', ), self.counts)
+            ),
+        }
+
+
+class Stats(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+        # When False, ``timed`` and ``instrument`` return what they're given
+        # unchanged, and ``record`` does nothing.
+        self.enabled = True
+
+        # Set by ``configure_dump`` to periodically save snapshots.
+        self.dump_path = None
+        self.dump_interval = None
+        self.last_dump = 0
+
+        self.reset()
+
+    def configure_dump(self, path, interval=60):
+        """
+        Saves a snapshot to ``path`` at most every ``interval`` seconds, when
+        an outermost timed call finishes.
+        """
+        self.dump_path = path
+        self.dump_interval = interval
+
+    def maybe_dump(self):
+        if not self.dump_path:
+            return
+
+        now = time.time()
+
+        if now - self.last_dump >= self.dump_interval:
+            self.last_dump = now
+            self.dump(self.dump_path)
+
+    def reset(self):
+        with self.lock:
+            self.counters = defaultdict(int)
+            self.histograms = {}
+
+    @property
+    def frames(self):
+        """
+        The per-thread stack of counts for the timed calls in progress.
+        """
+        frames = getattr(self.local, 'frames', None)
+
+        if frames is None:
+            frames = self.local.frames = []
+
+        return frames
+
+    def incr(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def observe(self, name, value, buckets=MS_BUCKETS):
+        with self.lock:
+            self._observe(name, value, buckets)
+
+    def _observe(self, name, value, buckets):
+        histogram = self.histograms.get(name)
+
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram(buckets)
+
+        histogram.observe(value)
+
+    def record(self, key, value=1):
+        """
+        Counts ``value`` toward ``key`` globally and for every timed call in
+        progress on this thread.
+        """
+        if not self.enabled:
+            return
+
+        self.incr(key, value)
+
+        for frame in self.frames:
+            frame[key] += value
+
+    def timed(self, name):
+        """
+        Decorator recording calls, errors, wall time and tracked quantities
+        under ``name``.
+        """
+        calls_name = name + '.calls'
+        errors_name = name + '.errors'
+        ms_name = name + '.ms'
+        tracked = [
+            (key, '{}.{}'.format(name, key), buckets)
+            for key, buckets in TRACKED
+        ]
+
+        def decorator(func):
+            if not self.enabled:
+                return func
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                frames = self.frames
+                frame = defaultdict(int)
+                frames.append(frame)
+                start = timeit.default_timer()
+
+                try:
+                    return func(*args, **kwargs)
+                except Exception:
+                    self.incr(errors_name)
+                    raise
+                finally:
+                    elapsed = timeit.default_timer() - start
+                    frames.pop()
+
+                    with self.lock:
+                        self.counters[calls_name] += 1
+                        self._observe(ms_name, elapsed * 1000, MS_BUCKETS)
+
+                        for key, histogram_name, buckets in tracked:
+                            self._observe(histogram_name, frame[key], buckets)
+
+                    if not frames:
+                        self.maybe_dump()
+
+            return wrapper
+        return decorator
+
+    def instrument(self, prefix, exclude=()):
+        """
+        Class decorator applying ``timed`` to every public method, named
+        ``prefix.method``. Generator functions and ``exclude`` are skipped.
+        """
+        def decorator(cls):
+            if not self.enabled:
+                return cls
+
+            for name, value in list(vars(cls).items()):
+                if (
+                    name.startswith('_') or
+                    name in exclude or
+                    not inspect.isfunction(value) or
+                    inspect.isgeneratorfunction(value)
+                ):
+                    continue
+
+                timed = self.timed('{}.{}'.format(prefix, name))(value)
+                setattr(cls, name, timed)
+
+            return cls
+        return decorator
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'counters': dict(self.counters),
+                'histograms': dict(
+                    (name, histogram.snapshot())
+                    for name, histogram in self.histograms.items()
+                ),
+            }
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2, sort_keys=True)
+
+    @staticmethod
+    def load(path):
+        """
+        Returns a snapshot saved by ``dump``.
+        """
+        with open(path) as f:
+            return json.load(f)
+
+
+class CountingCursor(object):
+    """
+    Wraps an sqlite3 cursor, recording the rows fetched through it.
+    """
+    def __init__(self, cursor, stats):
+        self.cursor = cursor
+        self.stats = stats
+
+    def __iter__(self):
+        count = 0
+
+        try:
+            for row in self.cursor:
+                count += 1
+                yield row
+        finally:
+            self.stats.record('rows', count)
+
+    def fetchone(self):
+        row = self.cursor.fetchone()
+
+        if row is not None:
+            self.stats.record('rows')
+
+        return row
+
+    def fetchall(self):
+        rows = self.cursor.fetchall()
+        self.stats.record('rows', len(rows))
+
+        return rows
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+
+def format_snapshot(snapshot):
+    """
+    Returns a plain-text summary of a ``Stats.snapshot``.
+    """
+    lines = ['Counters:']
+
+    for name, value in sorted(snapshot['counters'].items()):
+        lines.append('  {:<50} {}'.format(name, value))
+
+    lines.append('')
+    lines.append('Histograms:')
+    template = '  {:<50} {:>8} {:>10} {:>10} {:>10}'
+    lines.append(template.format('', 'count', 'mean', 'p50', 'p99'))
+
+    for name, histogram in sorted(snapshot['histograms'].items()):
+        lines.append(template.format(
+            name,
+            histogram['count'],
+            '{:.2f}'.format(histogram['mean'] or 0),
+            histogram['p50'],
+            histogram['p99'],
+        ))
+
+    return '\n'.join(lines)
+
+
+registry = Stats()
+timed = registry.timed
+instrument = registry.instrument
+record = registry.record
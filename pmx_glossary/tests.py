@@ -1,9 +1,25 @@
 import os
 import datetime
+import json
 import random
+import sqlite3
+import tempfile
+import threading
+import time
 import unittest
 
-from pmx_glossary import glossary
+from click.testing import CliRunner
+
+from pmx_glossary import benchmarks, cli, columnar, glossary, stats
+from pmx_glossary.cache import LRUCache, NullCache, make_cache
+from pmx_glossary.index import NgramIndex, edit_distance
+
+try:
+    import asyncio
+    from pmx_glossary import aio
+except (ImportError, SyntaxError):
+    # Python 2
+    aio = None
 
 
 class GlossaryTestCase(unittest.TestCase):
@@ -104,6 +120,15 @@ class GlossaryTestCase(unittest.TestCase):
     def _call_whowrote(self, rest, nick=None):
         return self._call_command(glossary.who_wrote, rest, nick)
 
+    def _trace_statements(self):
+        """
+        Returns a list that collects every SQL statement the store runs.
+        """
+        statements = []
+        self.store.db.set_trace_callback(statements.append)
+
+        return statements
+
     def test_dump_and_load(self):
         self._load_test_definitions()
 
@@ -111,7 +136,7 @@ class GlossaryTestCase(unittest.TestCase):
         redirect_map = {}
 
         for redirect_from in redirects:
-            redirect_to = random.choice(self.TEST_DEFINITIONS.keys())
+            redirect_to = random.choice(list(self.TEST_DEFINITIONS.keys()))
             redirect_map[redirect_from] = redirect_to
 
             self._call_redirect('{}: {}'.format(redirect_from, redirect_to))
@@ -157,6 +182,360 @@ class GlossaryTestCase(unittest.TestCase):
 
         os.remove(filepath)
 
+    def test_repeated_query_is_cached(self):
+        self._call_define('fish: a swimmy thingy')
+        self._call_define('ting: a thing')
+        self._call_redirect('thing: ting')
+
+        expected_fish = self._call_whatis('fish')
+        expected_thing = self._call_whatis('thing')
+
+        statements = self._trace_statements()
+
+        self.assertEqual(self._call_whatis('fish'), expected_fish)
+        self.assertEqual(self._call_whatis('thing'), expected_thing)
+        self.assertEqual(statements, [])
+
+    def test_uncached_query_is_one_statement(self):
+        self._call_define('fish: a swimmy thingy')
+        self._call_define('ting: a thing')
+        self._call_redirect('thing: ting')
+
+        expected_fish = self._call_whatis('fish')
+        expected_thing = self._call_whatis('thing')
+        expected_miss = self._call_whatis('nothing')
+
+        for entry, expected in (
+            ('fish', expected_fish),
+            ('thing', expected_thing),
+            ('nothing', expected_miss),
+        ):
+            self.store.cache.clear()
+            statements = self._trace_statements()
+
+            self.assertEqual(self._call_whatis(entry), expected)
+            self.assertEqual(len(statements), 1)
+
+    def test_batch_query(self):
+        self._call_define('fish: a swimmy thingy')
+        self._call_define('Ting: a thing')
+        self._call_redirect('thing: ting')
+        self.store.cache.clear()
+
+        statements = self._trace_statements()
+
+        self.assertEqual(
+            self._call_whatis('fish, thing,nope, FISH, , ting'),
+            'fish: a swimmy thingy | thing (redirects to Ting): a thing | '
+            '"nope" is undefined | Ting: a thing'
+        )
+        self.assertEqual(len(statements), 1)
+
+        # Everything is cached now.
+        self._call_whatis('fish, thing, nope')
+        self.assertEqual(len(statements), 1)
+
+        self.assertEqual(
+            self._call_whatis('fish, thing: 2'), glossary.HELP_QUERY_STR
+        )
+        self.assertEqual(self._call_whatis(','), glossary.HELP_QUERY_STR)
+        self.assertEqual(
+            self._call_whatis(' ,  , '), glossary.HELP_QUERY_STR
+        )
+        self.assertEqual(
+            self._call_whatis(', '.join(
+                str(i) for i in range(glossary.BATCH_QUERY_LIMIT + 1)
+            )),
+            'I can only look up {} entries at a time.'.format(
+                glossary.BATCH_QUERY_LIMIT
+            )
+        )
+
+    def test_get_latest_records(self):
+        for entry in ('a', 'b', 'c', 'd', 'e'):
+            self._call_define('{}: letter {}'.format(entry, entry))
+
+        self.store.cache.clear()
+        self.store.IN_CHUNK_SIZE = 2
+        statements = self._trace_statements()
+
+        records = self.store.get_latest_records(
+            ['A', 'b', 'c', 'nope', 'd', 'e', 'a']
+        )
+
+        self.assertEqual(len(statements), 3)
+        self.assertEqual(
+            sorted(records), ['a', 'b', 'c', 'd', 'e', 'nope']
+        )
+        self.assertIsNone(records['nope'])
+        self.assertEqual(records['a'], self.store.get_latest_record('a'))
+        self.assertEqual(records['e'].definition, 'letter e')
+        self.assertEqual(len(statements), 3)
+
+    def test_get_nth_record(self):
+        for i in range(1, 51):
+            self._call_define('fish: swimmy thingy {}'.format(i))
+
+        self.store.cache.clear()
+        stats.registry.reset()
+
+        record = self.store.get_nth_record('FISH', 3)
+
+        self.assertEqual(record.definition, 'swimmy thingy 3')
+        self.assertEqual(record.index, 2)
+        self.assertEqual(record.total_count, 50)
+        self.assertEqual(stats.registry.snapshot()['counters']['rows'], 1)
+
+        self.assertIsNone(self.store.get_nth_record('fish', 0))
+        self.assertIsNone(self.store.get_nth_record('fish', 51))
+        self.assertIsNone(self.store.get_nth_record('nothing', 1))
+
+        # The revision cache is dropped when the entry changes.
+        self._call_define('fish: swimmy thingy 51')
+        self.assertEqual(self.store.get_nth_record('fish', 3).total_count, 51)
+
+    def test_entry_lookup_is_exact(self):
+        self._call_define('abc: not an underscore')
+        self._call_define('__underscores__: a dunder')
+
+        self.assertEqual(self.store.get_all_records_for_entry('a_c'), [])
+        self.assertEqual(self.store.get_all_records_for_entry('a%'), [])
+
+        records = self.store.get_all_records_for_entry('__underscores__')
+
+        self.assertEqual([r.definition for r in records], ['a dunder'])
+
+    def test_entry_lookup_query_plan(self):
+        self.store.cache.clear()
+        statements = self._trace_statements()
+
+        self.store.get_all_records_for_entry('fish')
+        self.store.get_nth_record('fish', 2)
+
+        self.assertEqual(len(statements), 2)
+
+        for statement in statements:
+            plan = ' '.join(
+                row[-1] for row in self.store.db.execute(
+                    'EXPLAIN QUERY PLAN ' + statement
+                )
+            )
+
+            self.assertIn(
+                'USING INDEX ix_glossary_entry_timestamp (entry_lower=?)', plan
+            )
+            self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_old_entry_index_is_replaced(self):
+        self.store.db.execute(
+            'CREATE INDEX ix_glossary_entry ON glossary(entry_lower)'
+        )
+        self.store.init_tables()
+
+        self.assertFalse(self.store.table_exists('ix_glossary_entry'))
+        self.assertTrue(self.store.table_exists('ix_glossary_entry_timestamp'))
+
+    def test_nth_query_fetches_one_revision(self):
+        for i in range(1, 51):
+            self._call_define('fish: swimmy thingy {}'.format(i))
+
+        self.store.cache.clear()
+        stats.registry.reset()
+
+        result = self._call_whatis('fish: 3')
+
+        self.assertTrue(result.startswith('fish (3/50): swimmy thingy 3 ['))
+        self.assertEqual(stats.registry.snapshot()['counters']['rows'], 2)
+
+    def test_cache_stats(self):
+        self._call_define('fish: a swimmy thingy')
+        self.store.cache.clear()
+        self.store.cache.reset_stats()
+
+        self._call_whatis('fish')
+        self._call_whatis('fish')
+
+        self.assertGreater(self.store.cache.hits, 0)
+        self.assertGreater(self.store.cache.misses, 0)
+
+    def test_record_cache_invalidation(self):
+        self._call_define('fish: a swimmy thingy')
+        self._call_define('ting: a thing')
+        self._call_whatis('fish')
+        self._call_whatis('thing')
+
+        self._call_define('fish: dinner')
+        self.assertEqual(
+            self._call_whatis('fish'), 'fish (2/2): dinner [just now]'
+        )
+
+        self._call_redirect('thing: ting')
+        self.assertEqual(self.store.get_redirect('thing').entry, 'ting')
+
+        self._call_unredirect('thing')
+        self.assertIsNone(self.store.get_redirect('thing'))
+
+    def test_add_entries(self):
+        self._call_define('fish: a swimmy thingy')
+        self._call_define('ting: a thing')
+        self._call_redirect('thing: ting')
+        self.store.get_all_records()
+
+        rows = [
+            dict(entry='fish', definition='a swimmy thingy', author='a'),
+            dict(entry='FISH', definition='dinner', author='a'),
+            dict(entry='fish', definition='dinner', author='b'),
+            dict(entry='thing', definition='redirected', author='a'),
+            dict(entry='salmon', definition='a fish', author='a'),
+        ]
+
+        statements = self._trace_statements()
+        inserted, skipped = self.store.add_entries(rows)
+
+        self.assertEqual(inserted, [rows[1], rows[4]])
+        self.assertEqual(skipped, [rows[0], rows[2], rows[3]])
+        self.assertEqual(
+            [s for s in statements if s.startswith(('BEGIN', 'COMMIT'))],
+            ['BEGIN', 'COMMIT']
+        )
+
+        self.assertEqual(
+            self._call_whatis('fish'), 'FISH (2/2): dinner [just now]'
+        )
+        self.assertEqual(
+            {r.entry for r in self.store.get_all_records()},
+            {'FISH', 'salmon', 'ting'}
+        )
+
+    def test_ndjson_load_checks_each_batch(self):
+        self._call_define('fish: a swimmy thingy')
+        self._call_define('castle: where salmon have scones')
+        self._call_redirect('fortress: castle')
+
+        rows = [
+            ('fish', 'a swimmy thingy'),
+            ('carrot', 'orange'),
+            ('potato', 'starchy'),
+            ('carrot', 'orange'),
+            ('fortress', 'a big house'),
+            ('leek', 'green'),
+        ]
+        _, filepath = self.store.dump_to_ndjson()
+
+        with open(filepath) as f:
+            fish = json.loads(f.readline())
+
+        with open(filepath, 'w') as f:
+            for entry, definition in rows:
+                f.write(json.dumps(
+                    dict(fish, entry=entry, definition=definition)
+                ) + '\n')
+
+        lookups = []
+        get_import_conflicts = self.store.get_import_conflicts
+
+        def spy(entry_lowers, match_timestamp=False):
+            lookups.append(set(entry_lowers))
+            return get_import_conflicts(entry_lowers, match_timestamp)
+
+        self.store.get_import_conflicts = spy
+
+        try:
+            counts = self.store.load_from_ndjson(filepath, batch_size=2)
+        finally:
+            del self.store.get_import_conflicts
+
+        # The existing fish, the repeated carrot from an earlier batch, and
+        # the redirected fortress are skipped.
+        self.assertEqual(counts['inserted'], 3)
+        self.assertEqual(
+            lookups,
+            [{'fish', 'carrot'}, {'potato', 'carrot'}, {'fortress', 'leek'}]
+        )
+
+        os.remove(filepath)
+
+    def test_save_entries(self):
+        glossary.Glossary.save_entries(self.TEST_DEFINITIONS)
+        inserted, skipped = glossary.Glossary.save_entries(
+            self.TEST_DEFINITIONS
+        )
+
+        self.assertEqual(inserted, [])
+        self.assertEqual(len(skipped), len(self.TEST_DEFINITIONS))
+        self.assertEqual(
+            len(self.store.get_all_records()), len(self.TEST_DEFINITIONS)
+        )
+
+    def test_ndjson_dump_and_load(self):
+        self._load_test_definitions()
+        self._call_define('castle: where salmon have scones')
+        self._call_redirect('fortress: castle')
+
+        counts, filepath = self.store.dump_to_ndjson()
+
+        self.assertEqual(counts, {
+            'entries': len(self.TEST_DEFINITIONS) + 1,
+            'redirects': 1
+        })
+        self.assertTrue(self.store.is_ndjson(filepath))
+
+        # Reloading what's already in the db should not affect anything.
+        statements = self._trace_statements()
+        counts = self.store.load_from_ndjson(filepath, batch_size=3)
+        self.assertEqual(counts['inserted'], 0)
+        self.assertFalse([
+            s for s in statements
+            if 'INSERT' in s and 'glossary_import_keys' not in s
+        ])
+
+        self.wipe_and_init_glossary()
+        self.store = glossary.Glossary.store
+
+        counts = self.store.load_from_ndjson(filepath, batch_size=3)
+        self.assertEqual(counts, {
+            'entries': len(self.TEST_DEFINITIONS) + 1,
+            'inserted': len(self.TEST_DEFINITIONS) + 1,
+            'redirects': 1,
+        })
+
+        self.assertEqual(
+            self._call_whatis('fortress'),
+            'fortress redirects to castle (2/2): '
+            'where salmon have scones [just now]'
+        )
+
+        json_filepath = self.store.dump_to_json()[1]
+        self.assertFalse(self.store.is_ndjson(json_filepath))
+
+        os.remove(filepath)
+        os.remove(json_filepath)
+
+    def test_command_stats(self):
+        self._call_define('fish: a swimmy thingy')
+        self.store.cache.clear()
+        stats.registry.reset()
+
+        self._call_whatis('fish')
+        self._call_whatis('fish')
+
+        snapshot = stats.registry.snapshot()
+        counters = snapshot['counters']
+        histograms = snapshot['histograms']
+
+        self.assertEqual(counters['command.query_command.calls'], 2)
+        self.assertGreater(counters['store.resolve_entry.calls'], 0)
+        self.assertGreater(counters['sql'], 0)
+        self.assertGreater(counters['rows'], 0)
+
+        # The first call goes to the database, the second is all cache hits.
+        sql = histograms['command.query_command.sql']
+        self.assertEqual(sql['min'], 0)
+        self.assertEqual(sql['max'], counters['sql'])
+        self.assertGreater(
+            histograms['command.query_command.cache_hits']['max'], 0
+        )
+
     def test_add_and_retrieve_simple_definition(self):
         author = 'bojangles'
         entry = 'fish'
@@ -308,6 +687,213 @@ class GlossaryTestCase(unittest.TestCase):
         result = self._call_whatis('fish')
         self.assertEqual(result, expected_3)
 
+    def _committed_count(self, table='glossary'):
+        """
+        Returns the number of rows committed to ``table``, as seen by another
+        connection.
+        """
+        db = sqlite3.connect(self.DB_FILE)
+
+        try:
+            sql = 'SELECT COUNT(*) FROM {}'.format(table)
+            return db.execute(sql).fetchone()[0]
+        finally:
+            db.close()
+
+    def _enable_write_behind(self, size=100, interval=60):
+        self.store.write_behind = True
+        self.store.flush_size = size
+        self.store.flush_interval = interval
+
+    def test_write_behind(self):
+        self._enable_write_behind()
+
+        self._call_define('fish: a swimmy thingy')
+        self._call_define('fish: a swimmier thingy')
+        self._call_define('ting: a thing')
+        self._call_redirect('thing: ting')
+
+        self.assertEqual(self._committed_count(), 0)
+        self.assertEqual(len(self.store.pending), 4)
+
+        # Queued writes are visible through the cache.
+        statements = self._trace_statements()
+
+        self.assertTrue(
+            self._call_whatis('fish').startswith(
+                'fish (2/2): a swimmier thingy'
+            )
+        )
+        self.assertTrue(
+            self._call_whatis('thing').startswith(
+                'thing redirects to ting (1/1): a thing'
+            )
+        )
+        self.assertEqual(statements, [])
+
+        # Reading from the database flushes first, in one transaction.
+        self.assertTrue(
+            self._call_whatis('fish: 1').startswith(
+                'fish (1/2): a swimmy thingy'
+            )
+        )
+        self.assertEqual(self.store.pending, [])
+        self.assertEqual(statements.count('BEGIN'), 1)
+        self.assertEqual(self._committed_count(), 3)
+        self.assertEqual(self._committed_count('glossary_redirects'), 1)
+
+    def test_write_behind_matches_sync_results(self):
+        old = datetime.datetime(2014, 10, 1)
+        sync_results = [
+            self.store.add_entry('fish', 'a swimmy thingy', 'author'),
+            self.store.add_entry('fIsh', 'old swimmer', 'author', timestamp=old),
+        ]
+
+        self.wipe_and_init_glossary()
+        self.store = glossary.Glossary.store
+        self._enable_write_behind()
+
+        queued_results = [
+            self.store.add_entry('fish', 'a swimmy thingy', 'author'),
+            self.store.add_entry('fIsh', 'old swimmer', 'author', timestamp=old),
+        ]
+
+        self.assertEqual(
+            [(r.entry, r.definition, r.index, r.total_count)
+             for r in queued_results],
+            [(r.entry, r.definition, r.index, r.total_count)
+             for r in sync_results]
+        )
+
+        self.store.flush()
+        self.store.cache.clear()
+
+        self.assertEqual(self.store.get_latest_record('fish'), queued_results[-1])
+
+    def test_write_behind_thresholds(self):
+        self._enable_write_behind(size=2)
+
+        self._call_define('fish: a swimmy thingy')
+        self.assertEqual(self._committed_count(), 0)
+
+        self._call_define('ting: a thing')
+        self.assertEqual(self._committed_count(), 2)
+
+        self._enable_write_behind(interval=0)
+
+        self._call_define('castle: where salmon have tea')
+        self.assertEqual(self._committed_count(), 3)
+
+    def test_write_behind_flushed_on_finalize(self):
+        self._enable_write_behind()
+        self._call_define('fish: a swimmy thingy')
+
+        glossary.Glossary.finalize()
+        glossary.Glossary.store = self.store
+
+        self.assertEqual(self._committed_count(), 1)
+
+    def test_write_behind_kept_when_flush_fails(self):
+        self._enable_write_behind()
+        self._call_define('fish: a swimmy thingy')
+        self._call_redirect('swimmer: fish')
+
+        # Another writer holds the database, so the flush gets SQLITE_BUSY.
+        self.store.db.execute('PRAGMA busy_timeout = 0')
+        other = sqlite3.connect(self.DB_FILE)
+        other.execute('BEGIN IMMEDIATE')
+
+        try:
+            with self.assertRaises(sqlite3.OperationalError):
+                self.store.flush()
+
+            self.assertEqual(len(self.store.pending), 2)
+            self.assertIsNotNone(self.store.pending_since)
+            self.assertTrue(self.store.is_dirty('fish'))
+            self.assertEqual(self.store.redirects['swimmer'], 'fish')
+        finally:
+            other.rollback()
+            other.close()
+
+        self.assertTrue(
+            self._call_whatis('swimmer').startswith(
+                'swimmer redirects to fish (1/1): a swimmy thingy'
+            )
+        )
+        self.assertEqual(self.store.pending, [])
+        self.assertEqual(self._committed_count(), 1)
+        self.assertEqual(self._committed_count('glossary_redirects'), 1)
+
+    def test_write_behind_flushed_after_interval(self):
+        self._enable_write_behind(interval=0.1)
+        self._call_define('fish: a swimmy thingy')
+
+        # No other write or read comes along to flush it.
+        deadline = time.time() + 5
+
+        while not self._committed_count() and time.time() < deadline:
+            time.sleep(0.05)
+
+        self.assertEqual(self._committed_count(), 1)
+        self.assertEqual(self.store.pending, [])
+
+    def _pragma(self, name):
+        return self.store.db.execute('PRAGMA ' + name).fetchone()[0]
+
+    def test_pragma_profiles(self):
+        self.assertEqual(self.store.profile, 'default')
+        self.assertEqual(self._pragma('journal_mode'), 'delete')
+
+        self.store.apply_pragmas('fast')
+
+        self.assertEqual(self.store.profile, 'fast')
+        self.assertEqual(self._pragma('journal_mode'), 'wal')
+        self.assertEqual(self._pragma('synchronous'), 1)
+        self.assertEqual(self._pragma('temp_store'), 2)
+
+        self.assertRaises(ValueError, self.store.apply_pragmas, 'turbo')
+
+    def test_pragma_overrides(self):
+        missing = object()
+        config = getattr(glossary.pmxbot, 'config', missing)
+        glossary.pmxbot.config = {
+            'glossary_sqlite_profile': 'durable',
+            'glossary_sqlite_pragmas': {'cache_size': -1024},
+        }
+
+        try:
+            self.store.apply_pragmas()
+
+            self.assertEqual(self.store.profile, 'durable')
+            self.assertEqual(self._pragma('synchronous'), 2)
+            self.assertEqual(self._pragma('cache_size'), -1024)
+
+            glossary.pmxbot.config['glossary_sqlite_pragmas'] = {
+                'cache_size': '1; DROP TABLE glossary'
+            }
+            self.assertRaises(ValueError, self.store.apply_pragmas)
+        finally:
+            if config is missing:
+                del glossary.pmxbot.config
+            else:
+                glossary.pmxbot.config = config
+
+    def test_get_random_entry(self):
+        self.assertIsNone(self.store.get_random_entry())
+
+        self._load_test_definitions()
+        self.store.cache.clear()
+        statements = self._trace_statements()
+
+        random.seed(0)
+        entries = set(self.store.get_random_entry() for _ in range(200))
+
+        self.assertEqual(entries, set(self.TEST_DEFINITIONS))
+        self.assertEqual(len(statements), 200)
+
+        # The all-entries snapshot isn't built just to pick an entry.
+        self.assertIsNone(self.store.snapshot)
+
     def test_get_random_definition(self):
         self._load_test_definitions()
 
@@ -349,6 +935,53 @@ class GlossaryTestCase(unittest.TestCase):
             {r.entry for r in all_records_again}
         )
 
+    def test_all_entries_patched_on_insert(self):
+        self._load_test_definitions()
+        self.store.get_all_records()
+
+        statements = self._trace_statements()
+
+        self.store.add_entry('castle', 'where salmon have scones', 'author')
+        self.store.add_entry('aardvark', 'an early entry', 'author')
+
+        records = self.store.get_all_records()
+
+        self.assertFalse([s for s in statements if 'GROUP BY' in s])
+
+        keys = [r.entry_lower for r in records]
+        self.assertEqual(keys, sorted(keys))
+        self.assertEqual(len(records), len(self.TEST_DEFINITIONS) + 1)
+
+        castle = records[keys.index('castle')]
+        self.assertEqual(castle.definition, 'where salmon have scones')
+        self.assertEqual(castle.total_count, 2)
+        self.assertEqual(castle.index, 1)
+
+        # A rebuilt snapshot agrees with the patched one.
+        self.store.bust_all_entries_cache()
+        self.assertEqual(records, self.store.get_all_records())
+
+    def test_all_entries_outlive_the_cache(self):
+        self._load_test_definitions()
+        records = self.store.get_all_records()
+
+        statements = self._trace_statements()
+        self.store.cache.clear()
+
+        self.assertIs(self.store.get_all_records(), records)
+
+        # Not even a cache that holds nothing drops them.
+        self.store.cache = NullCache()
+        self.store.add_entry('aardvark', 'an early entry', 'author')
+
+        # The same list, patched in place.
+        self.assertIs(self.store.get_all_records(), records)
+        self.assertIn('aardvark', [r.entry for r in records])
+        self.assertEqual(len(records), len(self.TEST_DEFINITIONS) + 1)
+        self.assertEqual(
+            [s for s in statements if 'ORDER BY l.entry_lower' in s], []
+        )
+
     def test_get_words_like(self):
         entry_dict = {
             'a fish': 'just a fish',
@@ -363,6 +996,17 @@ class GlossaryTestCase(unittest.TestCase):
 
         self.assertEqual(result, set(entry_dict.keys()))
 
+    def test_get_words_like_after_insert(self):
+        self._load_test_definitions({'fishy': 'fishlike'})
+        self.assertEqual(self.store.get_similar_words('fish'), ['fishy'])
+
+        self._call_define('Gone Fishing: fishin')
+        self._call_define('FISHY: very fishlike')
+
+        self.assertEqual(
+            self.store.get_similar_words('fish'), ['FISHY', 'Gone Fishing']
+        )
+
     def test_punctuation_error_response(self):
         for punct_char in glossary.INVALID_ENTRY_CHARS:
             entry = 'entry' + punct_char
@@ -383,6 +1027,135 @@ class GlossaryTestCase(unittest.TestCase):
 
                 self.assertEqual(result, expected)
 
+    def test_fuzzy_suggestions_on_query_miss(self):
+        self._load_test_definitions({
+            'kubernetes': 'a ship',
+            'fish': 'a swimmy thingy',
+            'fishy': 'like a fish',
+        })
+
+        self.assertEqual(
+            self._call_whatis('kubernets'),
+            '"kubernets" is undefined. May I interest you in kubernetes?'
+        )
+
+        # Misspellings come first, then entries sharing a word.
+        self.assertEqual(
+            self._call_whatis('fishh'),
+            '"fishh" is undefined. May I interest you in fish or fishy?'
+        )
+
+        # New entries are suggested without rebuilding the index.
+        index = self.store.get_entry_index()
+        self._call_define('kubernetas: a typo')
+
+        self.assertIs(self.store.entry_index, index)
+        self.assertEqual(
+            self.store.get_fuzzy_matches('kubernets'),
+            ['kubernetas', 'kubernetes']
+        )
+        self.assertEqual(self.store.get_fuzzy_matches('fi'), [])
+
+    def test_repeated_miss_is_cached(self):
+        self._load_test_definitions({
+            'kubernetes': 'a ship',
+            'fishy': 'like a fish',
+        })
+
+        expected = self._call_whatis('fish')
+        stats.registry.reset()
+        statements = self._trace_statements()
+
+        self.assertEqual(self._call_whatis('fish'), expected)
+        self.assertEqual(self._call_whatis('FISH'), expected.replace(
+            '"fish"', '"FISH"'
+        ))
+        self.assertEqual(statements, [])
+        self.assertNotIn(
+            'store.get_fuzzy_matches.calls',
+            stats.registry.snapshot()['counters']
+        )
+
+    def test_suggestions_cut_short_are_not_cached(self):
+        self._load_test_definitions({'kubernetes': 'a ship'})
+
+        missing = object()
+        config = getattr(glossary.pmxbot, 'config', missing)
+        glossary.pmxbot.config = {'glossary_suggestion_budget': 0}
+
+        try:
+            self.assertEqual(glossary.get_suggestions('kubernets'), [])
+        finally:
+            if config is missing:
+                del glossary.pmxbot.config
+            else:
+                glossary.pmxbot.config = config
+
+        self.assertIsNone(self.store.get_cached_suggestions('kubernets'))
+        self.assertEqual(glossary.get_suggestions('kubernets'), ['kubernetes'])
+        self.assertEqual(
+            self.store.get_cached_suggestions('kubernets'), ['kubernetes']
+        )
+
+    def test_miss_cache_invalidation(self):
+        self._call_define('fishy: like a fish')
+
+        def suggestions(entry):
+            return self._call_whatis(entry).partition('interest you in ')[2]
+
+        self.assertEqual(suggestions('fish'), 'fishy?')
+        self.assertEqual(suggestions('kubernets'), '')
+
+        # Redefining an entry doesn't change any suggestions.
+        self._call_define('fishy: very like a fish')
+        self.assertIn('fish', self.store.miss_cache)
+
+        # New names and spellings do.
+        self._call_define('fish tank: a fish house')
+        self.assertEqual(suggestions('fish'), 'fishy or fish tank?')
+
+        self._call_define('Kubernetes: a ship')
+        self.assertEqual(suggestions('kubernets'), 'Kubernetes?')
+
+        self._call_define('KUBERNETES: a big ship')
+        self.assertEqual(suggestions('kubernets'), 'KUBERNETES?')
+
+        # A redirect turns the miss into a hit.
+        self._call_redirect('kubernets: kubernetes')
+        self.assertNotIn('kubernets', self.store.miss_cache)
+        self.assertIn('redirects to', self._call_whatis('kubernets'))
+
+    def test_suggestions_are_ranked_and_capped(self):
+        self._load_test_definitions(dict(
+            ('fish {}'.format(i), 'a fish') for i in range(20)
+        ))
+        self._load_test_definitions({
+            'fishy': 'like a fish',
+            'apple': 'a fruit',
+            'avocado': 'a fruit',
+            'banana': 'a fruit',
+        })
+        stats.registry.reset()
+
+        self.assertEqual(
+            glossary.get_suggestions('fish'),
+            ['fishy', 'fish 0', 'fish 1', 'fish 10', 'fish 11', 'fish 12',
+             'fish 13', 'fish 14', 'fish 15', 'fish 16']
+        )
+
+        # Short words only match the start of entries.
+        self.assertEqual(glossary.get_suggestions('a'), ['apple', 'avocado'])
+
+        # Prefix matches filled both lists without a substring search.
+        self.assertNotIn(
+            'store.get_similar_words.calls',
+            stats.registry.snapshot()['counters']
+        )
+
+        self.assertEqual(
+            list(glossary.iter_suggestions('fish', deadline=0)), []
+        )
+
     def test_get_alternative_suggestions(self):
         self._load_test_definitions({
             'dataplasm': 'a plasm full of data',
@@ -422,6 +1195,126 @@ class GlossaryTestCase(unittest.TestCase):
 
         self.assertIn(': FisH and fish head.', result)
 
+    def _require_fts(self):
+        if not self.store.fts_enabled:
+            self.skipTest('This SQLite build lacks FTS5 or its trigram tokenizer')
+
+    def test_search_definitions(self):
+        self._require_fts()
+        self._load_test_definitions()
+
+        fts_results = self.store.search_definitions('SALMON')
+        self.assertEqual(
+            set(fts_results), {'building', 'castle', 'fish Oil'}
+        )
+
+        statements = self._trace_statements()
+        self.store.search_definitions('salmon')
+        self.assertIn('MATCH', statements[0])
+
+        self.store.fts_enabled = False
+        self.assertEqual(
+            self.store.search_definitions('salmon'), sorted(fts_results)
+        )
+
+    def test_search_current_definitions(self):
+        self._call_define('fish: a salmon, maybe')
+        self._call_define('fish: a trout')
+        self._call_define('pond: where salmon live')
+
+        for fts_enabled in {self.store.fts_enabled, False}:
+            self.store.fts_enabled = fts_enabled
+
+            self.assertEqual(self.store.search_definitions('salmon'), ['pond'])
+            self.assertEqual(
+                set(self.store.search_definitions(
+                    'salmon', include_history=True
+                )),
+                {'fish', 'pond'}
+            )
+
+    def test_latest_table(self):
+        self._call_define('fish: swimmer')
+        self._call_define('FISH: big swimmer')
+
+        # A revision loaded with an older timestamp is not the latest.
+        old = datetime.datetime(2014, 10, 1)
+        self.store.add_entry('fIsh', 'old swimmer', 'author', timestamp=old)
+
+        record = self.store.get_latest_record('fish')
+        self.assertEqual(record.entry, 'FISH')
+        self.assertEqual(record.definition, 'big swimmer')
+        self.assertEqual(record.total_count, 3)
+        self.assertEqual(record.index, 2)
+
+        # Existing databases are migrated.
+        self.store.db.execute('DROP TABLE glossary_latest')
+        self.store.init_tables()
+        self.store.cache.clear()
+
+        self.assertEqual(self.store.get_latest_record('fish'), record)
+
+    def test_search_definitions_short_string(self):
+        self._load_test_definitions()
+
+        self.assertEqual(
+            self.store.search_definitions('oa'), ['__underscores__']
+        )
+
+    def test_fts_migration(self):
+        self._require_fts()
+        self._load_test_definitions()
+
+        for name in ('insert', 'delete', 'update'):
+            self.store.db.execute('DROP TRIGGER glossary_fts_' + name)
+
+        self.store.db.execute('DROP TABLE glossary_fts')
+        self.store.db.commit()
+
+        self.store.init_tables()
+
+        self.assertTrue(self.store.fts_enabled)
+        self.assertEqual(
+            set(self.store.search_definitions('salmon')),
+            {'building', 'castle', 'fish Oil'}
+        )
+
+    def test_search_definitions_without_fts(self):
+        self._load_test_definitions()
+
+        # Simulate a build without the trigram tokenizer.
+        for name in ('insert', 'delete', 'update'):
+            self.store.db.execute(
+                'DROP TRIGGER IF EXISTS glossary_fts_' + name
+            )
+
+        self.store.db.execute('DROP TABLE IF EXISTS glossary_fts')
+        self.store.db.commit()
+        self.store.CREATE_FTS_SQL = """
+          CREATE VIRTUAL TABLE glossary_fts USING fts5(
+            definition, tokenize = 'no_such_tokenizer'
+          )
+        """
+
+        self.store.init_tables()
+        self.assertFalse(self.store.fts_enabled)
+
+        statements = self._trace_statements()
+
+        self.assertEqual(
+            self.store.search_definitions('SALMON'),
+            ['building', 'castle', 'fish Oil']
+        )
+        self.assertIn('LIKE', statements[0])
+
+        # Definitions added without the index are still found.
+        self._call_define('pond: where salmon live')
+        self.assertEqual(
+            self._call_search('salmon'),
+            'Found glossary entries: Salmon-person, building, castle, '
+            'fish Oil, and pond. To get a definition: `!whatis <entry>`'
+        )
+
     def test_simple_redirect(self):
         self._call_define('Bad Dude: one bad summagun')
         self._call_define('cool Dude: one cool summagun')
@@ -479,6 +1372,93 @@ class GlossaryTestCase(unittest.TestCase):
             '"thingy" is itself being redirected to "tom tom tom."'
         )
 
+    def test_redirects_are_held_in_memory(self):
+        self._call_define('ting: a thing')
+        self._call_redirect('thing: ting')
+        self._call_whatis('thing')
+
+        statements = self._trace_statements()
+
+        self.assertEqual(self.store.get_redirect('thing').entry, 'ting')
+        self.assertIsNone(self.store.get_redirect('ting'))
+        self.assertEqual(statements, [])
+
+        # A new connection reads them back from the table.
+        glossary.pmxbot.storage.SelectableStorage.finalize()
+        glossary.Glossary.initialize(
+            'sqlite:' + self.DB_FILE, load_fixtures=False
+        )
+        self.assertEqual(glossary.Glossary.store.redirects, {'thing': 'ting'})
+
+    def test_multi_hop_redirects(self):
+        self._load_test_definitions({'fish': 'a swimmy thingy'})
+        self.store.max_redirect_hops = 3
+
+        self._call_redirect('swimmer: fish')
+        self._call_redirect('gill haver: swimmer')
+        self._call_redirect('finned friend: gill haver')
+
+        self.assertEqual(
+            self._call_whatis('finned friend'),
+            'finned friend redirects to fish (1/1): a swimmy thingy '
+            '[just now]'
+        )
+        self.assertEqual(
+            self._call_redirect('scaly: finned friend'),
+            '"finned friend" is itself being redirected to "gill haver."'
+        )
+        self.assertEqual(
+            self._call_redirect('fish: gill haver'),
+            '"gill haver" already leads back to "fish."'
+        )
+
+        # Chains lengthened from upstream are followed as far as allowed.
+        self.store.max_redirect_hops = 2
+        self.assertEqual(
+            self.store.resolve_redirect('finned friend'), 'swimmer'
+        )
+        self.assertIsNone(self.store.get_redirect('finned friend'))
+        self.assertEqual(self.store.resolve_redirect('gill haver'), 'fish')
+
+        self.store.max_redirect_hops = 1
+        self.assertEqual(self.store.resolve_redirect('gill haver'), 'swimmer')
+
+    def test_remove_multi_hop_redirect(self):
+        self._load_test_definitions({'Fish': 'a swimmy thingy'})
+        self.store.max_redirect_hops = 2
+
+        self._call_redirect('swimmer: fish')
+        self._call_redirect('gill haver: swimmer')
+
+        self.assertEqual(
+            self._call_unredirect('gill haver'),
+            '"gill haver" is no longer being redirected to "swimmer"'
+        )
+        self.assertEqual(
+            self._call_unredirect('swimmer'),
+            '"swimmer" is no longer being redirected to "Fish"'
+        )
+        self.assertEqual(
+            self._call_unredirect('swimmer'),
+            '"swimmer" is not being redirected anywhere.'
+        )
+
+    def test_redirect_cycles_in_table(self):
+        self._load_test_definitions({'fish': 'a swimmy thingy'})
+        self.store.max_redirect_hops = 5
+        self.store.executemany(
+            """
+              INSERT INTO glossary_redirects (redirect_from, redirect_to)
+              VALUES (?, ?)
+            """,
+            [('a', 'b'), ('b', 'c'), ('c', 'a')]
+        )
+        self.store.load_redirects()
+
+        self.assertEqual(self.store.get_redirect_chain('a'), ['b', 'c'])
+        self.assertEqual(self.store.resolve_redirect('a'), 'c')
+        self.assertEqual(self._call_whatis('a'), '"a" is undefined')
+
     def test_remove_redirect(self):
         self._load_test_definitions({
             'thingy': 'flamma jam',
@@ -530,6 +1510,534 @@ class GlossaryTestCase(unittest.TestCase):
         self.assertEqual(result, expected)
 
 
+@unittest.skipUnless(aio, 'requires Python 3')
+class AsyncGlossaryTestCase(unittest.TestCase):
+    DB_FILE = 'pmxbot_test.sqlite'
+
+    def setUp(self):
+        if os.path.exists(self.DB_FILE):
+            os.remove(self.DB_FILE)
+
+        glossary.Glossary.initialize(
+            'sqlite:' + self.DB_FILE, load_fixtures=False
+        )
+        self.store = glossary.Glossary.store
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self._run(aio.get_worker().run(self.store.close))
+        self.loop.close()
+        glossary.pmxbot.storage.SelectableStorage.finalize()
+
+    def _run(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def test_store_methods_run_on_worker(self):
+        async_store = aio.AsyncGlossary()
+
+        try:
+            record = self._run(
+                async_store.add_entry('fish', 'a swimmy thingy', 'tester')
+            )
+            self.assertEqual(record.definition, 'a swimmy thingy')
+            self.assertEqual(
+                self._run(async_store.get_latest_record('FISH')), record
+            )
+
+            worker_thread = self._run(async_store.run(threading.current_thread))
+            self.assertIsNot(worker_thread, threading.current_thread())
+
+            # The sync API still works, on its own connection.
+            self.assertEqual(self.store.get_latest_record('fish'), record)
+        finally:
+            self._run(async_store.close())
+
+    def test_threads_share_caches(self):
+        async_store = aio.AsyncGlossary()
+
+        try:
+            self.store.add_entry('fish', 'a swimmy thingy', 'tester')
+            self.assertEqual(self.store.get_similar_words('fis'), ['fish'])
+
+            # Cached on the worker, then changed on this thread.
+            self._run(async_store.get_latest_record('fish'))
+            self.store.add_entry('fish', 'dinner', 'tester')
+            self.assertEqual(
+                self._run(async_store.get_latest_record('fish')).definition,
+                'dinner'
+            )
+
+            # And the other way around.
+            self._run(async_store.add_entry('fishy', 'suspicious', 'tester'))
+            self._run(async_store.add_redirect('swimmer', 'fish'))
+            self.assertEqual(
+                self.store.get_similar_words('fis'), ['fish', 'fishy']
+            )
+            self.assertEqual(
+                self.store.resolve_entry('swimmer').redirect.definition,
+                'dinner'
+            )
+            self.assertIs(
+                self._run(async_store.run(lambda: self.store.cache)),
+                self.store.cache
+            )
+        finally:
+            self._run(async_store.close())
+
+    def test_async_write_behind_flushed_on_finalize(self):
+        self.store.write_behind = True
+        self.store.flush_interval = 60
+
+        kwargs = dict(
+            client='client', event='event', channel='channel', nick='tester'
+        )
+        self._run(aio.define(rest='fish: a swimmy thingy', **kwargs))
+        self.assertEqual(len(self.store.pending), 1)
+
+        glossary.Glossary.finalize()
+        glossary.Glossary.store = self.store
+
+        db = sqlite3.connect(self.DB_FILE)
+
+        try:
+            sql = "SELECT COUNT(*) FROM glossary WHERE entry = 'fish'"
+            self.assertEqual(db.execute(sql).fetchone()[0], 1)
+        finally:
+            db.close()
+
+    def test_async_commands(self):
+        kwargs = dict(
+            client='client', event='event', channel='channel', nick='tester'
+        )
+
+        self._run(aio.define(rest='fish: a swimmy thingy', **kwargs))
+        response = self._run(aio.query_command(rest='fish', **kwargs))
+
+        self.assertTrue(response.startswith('fish (1/1): a swimmy thingy'))
+        self.assertEqual(
+            response, glossary.query_command(rest='fish', **kwargs)
+        )
+
+
+class BenchmarkTestCase(unittest.TestCase):
+    def tearDown(self):
+        glossary.pmxbot.storage.SelectableStorage.finalize()
+
+    def test_run_benchmarks(self):
+        finalizers = list(glossary.Glossary._finalizers)
+
+        report = benchmarks.run_benchmarks(
+            sizes=(20, 30), revisions=2, iterations=5
+        )
+
+        # Each size gets its own store, without touching the bot's.
+        self.assertEqual(glossary.Glossary._finalizers, finalizers)
+        self.assertFalse(hasattr(glossary.Glossary, 'store'))
+        self.assertIn('30', report['results'])
+
+        results = report['results']['20']
+
+        for name in (
+            'define', 'query_command', 'query_command_miss',
+            'query_command_random', 'search', 'who_wrote',
+            'jsondump_ndjson', 'jsonload_json',
+        ):
+            self.assertIn(name, results)
+            self.assertIn('p50_ms', results[name])
+            self.assertIn('p99_ms', results[name])
+            self.assertIn('ops_per_sec', results[name])
+
+        self.assertEqual(results['define']['count'], 5)
+        self.assertIn('query_command', benchmarks.format_report(report))
+
+
+class StatsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.stats = stats.Stats()
+
+    def test_timed(self):
+        @self.stats.timed('outer')
+        def outer():
+            self.stats.record('sql', 2)
+            inner()
+
+        @self.stats.timed('inner')
+        def inner():
+            self.stats.record('sql')
+
+        outer()
+        outer()
+
+        snapshot = self.stats.snapshot()
+
+        self.assertEqual(snapshot['counters']['outer.calls'], 2)
+        self.assertEqual(snapshot['counters']['inner.calls'], 2)
+        self.assertEqual(snapshot['counters']['sql'], 6)
+        self.assertEqual(snapshot['histograms']['outer.sql']['max'], 3)
+        self.assertEqual(snapshot['histograms']['inner.sql']['max'], 1)
+        self.assertEqual(snapshot['histograms']['outer.ms']['count'], 2)
+
+    def test_disabled(self):
+        self.stats.enabled = False
+
+        def func():
+            self.stats.record('sql')
+
+        class Store(object):
+            def method(self):
+                pass
+
+        self.assertIs(self.stats.timed('func')(func), func)
+        self.assertIs(
+            self.stats.instrument('store')(Store).method, Store.method
+        )
+
+        func()
+        self.assertEqual(self.stats.snapshot()['counters'], {})
+
+    def test_internal_store_methods_not_instrumented(self):
+        store_class = glossary.SQLiteGlossary
+
+        for name in ('run_flusher', 'is_dirty', 'table_exists', 'shutdown'):
+            method = getattr(store_class, name)
+            self.assertFalse(hasattr(method, '__wrapped__'))
+
+        self.assertTrue(hasattr(store_class.get_latest_record, '__wrapped__'))
+
+    def test_timed_error(self):
+        @self.stats.timed('broken')
+        def broken():
+            raise ValueError
+
+        self.assertRaises(ValueError, broken)
+        self.assertEqual(self.stats.counters['broken.errors'], 1)
+        self.assertEqual(self.stats.counters['broken.calls'], 1)
+
+    def test_histogram_percentiles(self):
+        histogram = stats.Histogram((1, 10, 100))
+
+        for value in range(1, 101):
+            histogram.observe(value)
+
+        self.assertEqual(histogram.percentile(50), 100)
+        self.assertEqual(histogram.percentile(5), 10)
+        self.assertEqual(histogram.snapshot()['count'], 100)
+
+    def test_dump_and_stats_command(self):
+        self.stats.incr('command.define.calls', 3)
+        self.stats.observe('command.define.ms', 1.5)
+
+        fd, path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        self.stats.dump(path)
+
+        result = CliRunner().invoke(cli.cli, ['stats', '--path', path])
+        os.remove(path)
+
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('command.define.calls', result.output)
+        self.assertIn('command.define.ms', result.output)
+
+
+class LRUCacheTestCase(unittest.TestCase):
+    def test_get_and_set(self):
+        cache = LRUCache(max_size=2)
+        cache.set('a', 1)
+
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('b', 'default'), 'default')
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(max_size=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertIn('c', cache)
+        self.assertEqual(len(cache), 2)
+
+    def test_ttl_expiry(self):
+        cache = LRUCache(max_size=2, ttl=0.01)
+        cache.set('a', 1)
+        time.sleep(0.02)
+
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(len(cache), 0)
+
+    def test_delete(self):
+        cache = LRUCache()
+        cache.set('a', 1)
+        cache.delete('a')
+        cache.delete('missing')
+
+        self.assertNotIn('a', cache)
+
+    def test_stats(self):
+        cache = LRUCache(max_size=1)
+        cache.set('a', 1)
+        cache.get('a')
+        cache.get('b')
+        cache.set('b', 2)
+
+        stats = cache.stats()
+
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['evictions'], 1)
+        self.assertEqual(stats['hit_rate'], 0.5)
+        self.assertEqual(stats['size'], 1)
+
+
+class NgramIndexTestCase(unittest.TestCase):
+    ENTRIES = ('a fish', 'fishy', 'Gone Fishing', 'gofish', 'zamboni')
+
+    def setUp(self):
+        self.index = NgramIndex()
+
+        for entry in self.ENTRIES:
+            self.index.add(entry)
+
+    def test_long_substring(self):
+        self.assertEqual(
+            self.index.search('fish'),
+            ['a fish', 'fishy', 'gofish', 'Gone Fishing']
+        )
+        self.assertEqual(self.index.search('fishing'), ['Gone Fishing'])
+        self.assertEqual(self.index.search('fishes'), [])
+
+    def test_short_substring(self):
+        self.assertEqual(self.index.search('z'), ['zamboni'])
+        self.assertEqual(self.index.search('go'), ['gofish', 'Gone Fishing'])
+        self.assertEqual(self.index.search('q'), [])
+
+    def test_empty_substring(self):
+        self.assertEqual(len(self.index.search('')), len(self.ENTRIES))
+
+    def test_edit_distance(self):
+        self.assertEqual(edit_distance('kitten', 'sitting'), 3)
+        self.assertEqual(edit_distance('', 'abc'), 3)
+        self.assertEqual(edit_distance('same', 'same'), 0)
+        self.assertEqual(edit_distance('kitten', 'sitting', limit=1), 2)
+        self.assertEqual(edit_distance('a', 'abcdef', limit=2), 3)
+
+    def test_fuzzy_search(self):
+        self.assertEqual(
+            self.index.fuzzy_search('fishu', 1),
+            [(1, 'fishy')]
+        )
+        self.assertEqual(
+            self.index.fuzzy_search('gone fishin', 2),
+            [(1, 'Gone Fishing')]
+        )
+        self.assertEqual(
+            self.index.fuzzy_search('go fish', 2),
+            [(1, 'gofish'), (2, 'a fish')]
+        )
+        self.assertEqual(
+            self.index.fuzzy_search('go fish', 2, limit=1), [(1, 'gofish')]
+        )
+        self.assertEqual(self.index.fuzzy_search('fishy', 0), [(0, 'fishy')])
+        self.assertEqual(self.index.fuzzy_search('trombone', 2), [])
+        self.assertEqual(self.index.fuzzy_search('fishy', 1, deadline=0), [])
+
+    def test_fuzzy_search_matches_linear_scan(self):
+        for entry in ('fist', 'dish', 'zambonis', 'fishing', 'gof'):
+            self.index.add(entry)
+
+        entries = list(self.index.entries.values())
+
+        for query in ('fsh', 'fishs', 'zamboni', 'go fishing', 'qqqq', 'a'):
+            for max_distance in (1, 2, 3):
+                expected = sorted(
+                    (edit_distance(query, entry.lower()), entry)
+                    for entry in entries
+                    if edit_distance(query, entry.lower()) <= max_distance
+                )
+
+                self.assertEqual(
+                    self.index.fuzzy_search(query, max_distance), expected
+                )
+
+    def test_prefix(self):
+        self.assertEqual(
+            list(self.index.iter_prefix('Go')), ['gofish', 'Gone Fishing']
+        )
+        self.assertEqual(list(self.index.iter_prefix('fishy!')), [])
+        self.assertEqual(
+            list(self.index.iter_prefix('')),
+            ['a fish', 'fishy', 'gofish', 'Gone Fishing', 'zamboni']
+        )
+
+    def test_add_updates_display_entry(self):
+        self.index.add('FISHY')
+
+        self.assertIn('FISHY', self.index.search('fishy'))
+        self.assertEqual(len(self.index), len(self.ENTRIES))
+
+
+class NullCacheTestCase(unittest.TestCase):
+    def test_never_stores(self):
+        cache = NullCache()
+        cache.set('a', 1)
+
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.misses, 1)
+        self.assertEqual(len(cache), 0)
+
+    def test_make_cache(self):
+        self.assertIsInstance(make_cache('none', max_size=10), NullCache)
+        self.assertIsInstance(make_cache('lru', max_size=10), LRUCache)
+        self.assertRaises(ValueError, make_cache, 'memcached')
+
+
+@unittest.skipUnless(columnar.numpy, 'numpy is not installed')
+class ColumnarSnapshotTestCase(unittest.TestCase):
+    NOW = 1413763200
+    DAY = 24 * 60 * 60
+
+    def setUp(self):
+        rows = (
+            ('Fish', 'tester_person', self.NOW - 60, 3),
+            ('fish oil', 'bojangles', self.NOW - 2 * self.DAY, 1),
+            ('castle', 'tester_person', self.NOW - 400 * self.DAY, 5),
+            ('snowman', 'tester_person', self.NOW - 20 * self.DAY, 1),
+        )
+        self.snapshot = columnar.ColumnarSnapshot(
+            glossary.GlossaryRecord(
+                entry, entry.lower(), 'a definition', author, '#channel',
+                timestamp, total_count - 1, total_count
+            )
+            for entry, author, timestamp, total_count in rows
+        )
+
+    def test_sorted_by_entry_lower(self):
+        self.assertEqual(len(self.snapshot), 4)
+        self.assertEqual(
+            list(self.snapshot.entries),
+            ['castle', 'Fish', 'fish oil', 'snowman']
+        )
+
+    def test_search(self):
+        self.assertEqual(self.snapshot.search('FISH'), ['Fish', 'fish oil'])
+        self.assertEqual(self.snapshot.search('nothing'), [])
+        self.assertEqual(
+            self.snapshot.contains('s').tolist(), [True, True, True, True]
+        )
+
+    def test_older_than(self):
+        self.assertEqual(
+            self.snapshot.older_than(self.DAY, now=self.NOW).tolist(),
+            [True, False, True, True]
+        )
+
+    def test_age_buckets(self):
+        self.assertEqual(
+            self.snapshot.age_buckets(now=self.NOW),
+            [
+                ('day', 1), ('week', 1), ('month', 1), ('year', 0),
+                ('older', 1),
+            ]
+        )
+
+    def test_top(self):
+        self.assertEqual(
+            self.snapshot.top(3), [('castle', 5), ('Fish', 3), ('fish oil', 1)]
+        )
+        self.assertEqual(
+            self.snapshot.top(1, by='timestamp'), [('Fish', self.NOW - 60)]
+        )
+        self.assertEqual(
+            self.snapshot.top(
+                5, mask=self.snapshot.older_than(7 * self.DAY, now=self.NOW)
+            ),
+            [('castle', 5), ('snowman', 1)]
+        )
+        self.assertEqual(self.snapshot.top(0), [])
+        self.assertRaises(ValueError, self.snapshot.top, 3, by='author')
+
+    def test_top_authors(self):
+        self.assertEqual(
+            self.snapshot.top_authors(),
+            [('tester_person', 3), ('bojangles', 1)]
+        )
+
+    def test_store_snapshot_invalidated_on_insert(self):
+        glossary.Glossary.initialize('sqlite::memory:', load_fixtures=False)
+        store = glossary.Glossary.store
+
+        try:
+            store.add_entry('fish', 'a swimmy thingy', 'tester_person')
+            self.assertEqual(store.get_columnar_snapshot().search('f'), ['fish'])
+            self.assertIs(
+                store.get_columnar_snapshot(), store.get_columnar_snapshot()
+            )
+
+            store.add_entry('fish oil', 'what salmon sell', 'tester_person')
+            self.assertEqual(
+                store.get_columnar_snapshot().search('f'), ['fish', 'fish oil']
+            )
+        finally:
+            glossary.pmxbot.storage.SelectableStorage.finalize()
+
+
+class ColumnarWithoutNumpyTestCase(unittest.TestCase):
+    def test_requires_numpy(self):
+        numpy = columnar.numpy
+        columnar.numpy = None
+
+        try:
+            self.assertRaises(ImportError, columnar.ColumnarSnapshot, [])
+        finally:
+            columnar.numpy = numpy
+
+
+class GlossaryRecordTestCase(unittest.TestCase):
+    def _make_record(self, **kwargs):
+        values = dict(
+            entry='Fish',
+            entry_lower='fish',
+            definition='a swimmy thingy',
+            author='tester_person',
+            channel='#channel',
+            timestamp='1413763200',
+            index=0,
+            total_count=1,
+        )
+        values.update(kwargs)
+
+        return glossary.GlossaryRecord(**values)
+
+    def test_datetime(self):
+        record = self._make_record()
+
+        self.assertEqual(record.timestamp, 1413763200)
+        self.assertEqual(record.datetime, datetime.datetime(2014, 10, 20))
+
+    def test_tuple_interface(self):
+        record = self._make_record()
+
+        self.assertEqual(
+            list(record),
+            [
+                'Fish', 'fish', 'a swimmy thingy', 'tester_person', '#channel',
+                datetime.datetime(2014, 10, 20), 0, 1,
+            ]
+        )
+        self.assertEqual(record, self._make_record())
+        self.assertNotEqual(record, self._make_record(index=1))
+        self.assertEqual(len({record, self._make_record()}), 1)
+
+    def test_slots(self):
+        record = self._make_record()
+
+        self.assertFalse(hasattr(record, '__dict__'))
+        self.assertRaises(AttributeError, setattr, record, 'extra', 1)
+
+
 class ReadableJoinTestCase(unittest.TestCase):
     def test_no_items(self):
         self.assertEqual(None, glossary.readable_join([]))
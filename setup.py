@@ -17,6 +17,9 @@ setup(
         'python-dateutil',
         'click',
     ],
+    extras_require=dict(
+        columnar=['numpy'],
+    ),
     entry_points=dict(
         console_scripts=[
             'pmxglos = pmx_glossary.cli:cli'